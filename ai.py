@@ -1,10 +1,19 @@
 import os
 import re
+import sys
+import json
+import time
+import atexit
+import hashlib
 import logging
+import threading
+import unicodedata
+from collections import OrderedDict, deque
 from http import HTTPStatus
-from typing import Dict, Optional, List, Any
+from typing import Any, Callable, Deque, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
 
-from dashscope import Application, MultiModalConversation
+from cache import TTLCache
+from metrics import timed
 
 # —— 配置 —— #
 API_KEY = os.getenv('DASHSCOPE_API_KEY', 'sk-e598553517e84d6fb57b3384382bf925')
@@ -14,8 +23,37 @@ SYS_PROMPT = (
     "人格非常外向，但是要符合用户问的话题，一次消息少发一点，只能发一条消息"
 )
 
-# 全局会话历史表
-message_table: Dict[str, List[Dict[str, Any]]] = {}
+# 会话表上限
+SESSION_MAX_USERS = 5000            # 最多保留多少个用户的会话（LRU 淘汰）
+SESSION_IDLE_TTL = 6 * 3600         # s，闲置超过该时长的会话作废
+HISTORY_MAX_LEN = 20                # 每个用户最多保留的历史条数
+SESSION_SNAPSHOT = os.getenv('AI_SESSION_FILE')   # 设置后定期落盘，重启后 session_id 仍可续用
+SNAPSHOT_INTERVAL = 60              # s
+
+# 流式回复
+STREAM_MIN_CHUNK = 12               # 每条消息至少多少字才按句子切出去
+STREAM_MAX_MSGS = 3                 # 一次回答最多拆成几条消息，最后一条兜住剩余内容
+
+# 回答缓存：只用于首轮提问和无状态提问，不影响已有会话的多轮上下文
+REPLY_CACHE_TTL = float(os.getenv('AI_CACHE_TTL', '600'))   # s，0 表示关闭
+REPLY_CACHE_MAX = 1000              # 最多缓存多少个回答（LRU 淘汰）
+REPLY_FLIGHT_WAIT = 60.0            # s，同一问题等别人的接口结果最多等多久，超时就自己调
+REPLY_CACHE_SHARED = os.getenv('AI_CACHE_SHARED') == '1'   # 默认按会话（好友 / 群）分开；设为 1 才所有会话共用一份回答
+STATELESS_PROMPTS = ("你是谁", "你叫什么", "你是什么", "你会什么")   # 不带上下文单独提问，随时可用缓存
+REPLY_CACHE_OPT_OUT = [u for u in os.getenv('AI_CACHE_OPT_OUT', '').split(',') if u]   # 不用缓存的会话
+
+# dashscope 导入要 0.3 s 以上，第一次调用接口时再导入（测试时可直接替换这两个名字）
+Application: Any = None
+MultiModalConversation: Any = None
+
+
+def _load_dashscope() -> None:
+    global Application, MultiModalConversation
+    if Application is None or MultiModalConversation is None:
+        import dashscope
+        Application = Application or dashscope.Application
+        MultiModalConversation = MultiModalConversation or dashscope.MultiModalConversation
+
 
 # 初始化日志
 logging.basicConfig(
@@ -25,12 +63,355 @@ logging.basicConfig(
 )
 
 
+class _Session:
+    __slots__ = ("sid", "history", "ts")
+
+    def __init__(self, max_history: int) -> None:
+        self.sid: Optional[str] = None
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=max_history)
+        self.ts: float = time.time()
+
+
+class SessionStore:
+    """
+    用户 → (session_id, 对话历史) 的有界存储：
+    LRU 容量上限 + 闲置过期 + 单用户历史条数上限，可选定期快照到磁盘。
+    ChatBot 只依赖下面这些公开方法，需要别的存储时实现同样的接口传给 ChatBot 即可。
+    """
+
+    def __init__(
+            self,
+            max_users: int = SESSION_MAX_USERS,
+            idle_ttl: float = SESSION_IDLE_TTL,
+            max_history: int = HISTORY_MAX_LEN,
+            snapshot: Optional[str] = SESSION_SNAPSHOT,
+            snapshot_interval: float = SNAPSHOT_INTERVAL
+    ) -> None:
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.max_history = max_history
+        self.snapshot = snapshot
+        self._data: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._writes = 0
+        self.evicted = 0
+        self.expired = 0
+
+        if snapshot:
+            self._restore()
+            atexit.register(self.save)
+            threading.Thread(target=self._autosave, args=(snapshot_interval,), daemon=True).start()
+
+    # —— 内部 —— #
+    def _get(self, user: str, create: bool = False) -> Optional[_Session]:
+        """调用方需持有锁"""
+        s = self._data.get(user)
+        now = time.time()
+        if s is not None and now - s.ts > self.idle_ttl:
+            del self._data[user]
+            self.expired += 1
+            s = None
+        if s is None:
+            if not create:
+                return None
+            s = self._data[user] = _Session(self.max_history)
+            while len(self._data) > self.max_users:
+                self._data.popitem(last=False)
+                self.evicted += 1
+        s.ts = now
+        self._data.move_to_end(user)
+        return s
+
+    def _touch(self) -> None:
+        """调用方需持有锁；每写 256 次顺带清一次过期会话"""
+        self._dirty = True
+        self._writes += 1
+        if self._writes % 256 == 0:
+            self.sweep()
+
+    # —— 公开接口 —— #
+    def add_user(self, user: str) -> bool:
+        """返回 True 表示新建"""
+        with self._lock:
+            if self._get(user) is not None:
+                return False
+            self._get(user, create=True)
+            self._touch()
+            return True
+
+    def add_history(self, user: str, role: str, content: Any) -> None:
+        with self._lock:
+            s = self._get(user)
+            if s is not None:
+                s.history.append({"role": role, "content": content})
+                self._touch()
+
+    def history(self, user: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            s = self._get(user)
+            return list(s.history) if s else []
+
+    def session_id(self, user: str) -> Optional[str]:
+        with self._lock:
+            s = self._get(user)
+            return s.sid if s else None
+
+    def set_session_id(self, user: str, sid: Optional[str]) -> None:
+        with self._lock:
+            self._get(user, create=True).sid = sid
+            self._touch()
+
+    def reset(self, user: str) -> None:
+        with self._lock:
+            s = self._data.get(user)
+            if s is not None:
+                s.sid = None
+                self._touch()
+
+    def sweep(self) -> int:
+        """清掉所有过期会话，返回清理数量"""
+        with self._lock:
+            dead = [u for u, s in self._data.items() if time.time() - s.ts > self.idle_ttl]
+            for u in dead:
+                del self._data[u]
+            self.expired += len(dead)
+            return len(dead)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = sys.getsizeof(self._data)
+            msgs = with_sid = 0
+            for u, s in self._data.items():
+                size += sys.getsizeof(u) + sys.getsizeof(s) + sys.getsizeof(s.history)
+                if s.sid:
+                    with_sid += 1
+                    size += sys.getsizeof(s.sid)
+                for h in s.history:
+                    msgs += 1
+                    size += sys.getsizeof(h) + sys.getsizeof(h["content"])
+            return {
+                "users": len(self._data),
+                "with_session": with_sid,
+                "history_msgs": msgs,
+                "approx_bytes": size,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+    # —— 快照 —— #
+    def save(self) -> None:
+        if not self.snapshot:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            snap = {u: {"sid": s.sid, "ts": s.ts, "history": list(s.history)}
+                    for u, s in self._data.items()}
+            self._dirty = False
+        tmp = f"{self.snapshot}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snap, f, ensure_ascii=False, default=str)
+            os.replace(tmp, self.snapshot)
+        except OSError:
+            logging.exception("会话快照写入失败")
+
+    def _restore(self) -> None:
+        try:
+            with open(self.snapshot, encoding="utf-8") as f:
+                snap = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logging.exception("会话快照读取失败，忽略")
+            return
+        now = time.time()
+        for u, d in sorted(snap.items(), key=lambda kv: kv[1].get("ts", 0)):
+            if now - d.get("ts", 0) > self.idle_ttl:
+                continue
+            s = self._data[u] = _Session(self.max_history)
+            s.sid, s.ts = d.get("sid"), d.get("ts", now)
+            s.history.extend(d.get("history", []))
+        while len(self._data) > self.max_users:
+            self._data.popitem(last=False)
+        logging.info(f"已恢复 {len(self._data)} 个会话")
+
+    def _autosave(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self.save()
+
+
+_MENTION = re.compile(r"@\S+")
+_NOISE = re.compile(r"[\s,.!?~:;'\"()、。，！？～…：；“”‘’（）]+")
+
+
+def normalize_prompt(text: str) -> str:
+    """缓存用的归一化：全半角统一、去掉 @xxx、标点和空白、转小写"""
+    text = _MENTION.sub(" ", unicodedata.normalize("NFKC", text))
+    return _NOISE.sub(" ", text).strip().lower()
+
+
+class _NotCached(Exception):
+    """调用失败：不写缓存，由 chat() 返回出错提示"""
+
+
+class ReplyCache:
+    """
+    (会话范围, 归一化提问, 系统提示词哈希) → 回答片段 的 TTL + LRU 缓存。
+    ChatBot 只在两种情况下查它：该会话还没有 session_id（首轮，回答与上下文无关），
+    或提问属于 stateless（这类提问不带 session_id 单独调用，也不改会话）。
+    默认按会话分开存，首轮提问只有在会话重置 / 过期后再问同一句才会命中，实际命中主要来自 stateless 提问。
+    同一问题同时到达时（流式 / 非流式一样）只有第一个去调接口，其余等它的结果。
+    """
+
+    def __init__(
+            self,
+            ttl: float = REPLY_CACHE_TTL,
+            maxsize: int = REPLY_CACHE_MAX,
+            shared: bool = REPLY_CACHE_SHARED,
+            stateless: Iterable[str] = STATELESS_PROMPTS,
+            opt_out: Iterable[str] = REPLY_CACHE_OPT_OUT,
+            flight_wait: float = REPLY_FLIGHT_WAIT
+    ) -> None:
+        self._cache: Optional[TTLCache] = TTLCache(ttl=ttl, maxsize=maxsize) if ttl > 0 else None
+        self.shared = shared
+        self.stateless = {normalize_prompt(p) for p in stateless}
+        self._opt_out = set(opt_out)
+        self.flight_wait = flight_wait
+        self._lock = threading.Lock()
+        self._flights: Dict[tuple, threading.Event] = {}     # key → 正在调接口的那次完成时置位
+        self.bypassed = 0                  # 因多轮会话 / 关闭缓存而没查缓存的次数
+        self.coalesced = 0                 # 等了别人同一问题的结果的次数
+
+    def is_stateless(self, prompt: str) -> bool:
+        return normalize_prompt(prompt) in self.stateless
+
+    def key(self, user: str, prompt: str, system_prompt: str, first_turn: bool) -> Optional[tuple]:
+        """不该走缓存时返回 None"""
+        norm = normalize_prompt(prompt)
+        if self._cache is None or not norm or user in self._opt_out or not (first_turn or norm in self.stateless):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        sp = hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()[:12]
+        return ("*" if self.shared else user), norm, sp
+
+    def set_opt_out(self, user: str, opt_out: bool = True) -> None:
+        with self._lock:
+            (self._opt_out.add if opt_out else self._opt_out.discard)(user)
+
+    def get(self, key: tuple) -> Optional[List[str]]:
+        return self._cache.get(key) if self._cache is not None else None
+
+    def put(self, key: tuple, parts: List[str]) -> None:
+        if self._cache is not None and parts:
+            self._cache.put(key, parts)
+
+    def claim(self, key: tuple) -> Tuple[Optional[List[str]], bool]:
+        """
+        → (缓存的回答, 是否由自己调接口)。没命中时第一个来的拿到 True，调完必须 release()；
+        同一问题后到的等它的结果，等超时返回 (None, False)：自己调接口、不写缓存。
+        """
+        while True:
+            with self._lock:
+                parts = self.get(key)
+                if parts is not None:
+                    return parts, False
+                ev = self._flights.get(key)
+                if ev is None:
+                    self._flights[key] = threading.Event()
+                    return None, True
+                self.coalesced += 1
+            if not ev.wait(self.flight_wait):
+                return None, False
+            # 对方成功时下一轮直接命中；失败时轮到自己调
+
+    def release(self, key: tuple, parts: Optional[List[str]]) -> None:
+        """claim() 拿到 True 的一方调完接口后调用；parts 为 None 表示失败，不写缓存"""
+        if parts:
+            self.put(key, parts)
+        with self._lock:
+            ev = self._flights.pop(key, None)
+        if ev is not None:
+            ev.set()
+
+    def load(self, key: tuple, loader: Callable[[], List[str]]) -> List[str]:
+        """同一问题同时到达时只调一次接口，其余等待同一个结果"""
+        parts, leader = self.claim(key)
+        if parts is not None:
+            return parts
+        parts = None
+        try:
+            parts = loader()
+            return parts
+        finally:
+            if leader:
+                self.release(key, parts)
+
+    def stats(self) -> Dict[str, Any]:
+        st = self._cache.stats() if self._cache is not None else {"size": 0, "hits": 0, "misses": 0, "hit_rate": 0.0}
+        return {**st, "bypassed": self.bypassed, "coalesced": self.coalesced, "opt_out": len(self._opt_out)}
+
+
+class _SentenceSplitter:
+    """
+    把增量文本按句末标点切成可以直接发送的片段：
+    • 片段清洗后不足 min_chunk 字时继续攒
+    • 还在 [...] 或 <think>...</think> 里面的位置不切，避免清洗规则被截断
+    • 已切出 max_msgs - 1 段后不再切，剩下的在 flush() 时作为最后一段
+    """
+    _END = re.compile(r"[。！？!?…~～\n]+")
+
+    def __init__(self, min_chunk: int = STREAM_MIN_CHUNK, max_msgs: int = STREAM_MAX_MSGS) -> None:
+        self.min_chunk = min_chunk
+        self.max_msgs = max(1, max_msgs)
+        self.sent = 0
+        self._buf = ""
+
+    @staticmethod
+    def _open(text: str) -> bool:
+        return text.rfind("[") > text.rfind("]") or text.rfind("<think>") > text.rfind("</think>")
+
+    def feed(self, delta: str) -> List[str]:
+        self._buf += delta
+        out: List[str] = []
+        while self.sent + len(out) < self.max_msgs - 1:
+            for m in self._END.finditer(self._buf):
+                head = self._buf[:m.end()]
+                if self._open(head):
+                    continue
+                cleaned = ChatBot._clean_response(head)
+                if len(cleaned) >= self.min_chunk:
+                    out.append(cleaned)
+                    self._buf = self._buf[m.end():]
+                    break
+            else:
+                break
+        self.sent += len(out)
+        return out
+
+    def flush(self) -> List[str]:
+        cleaned = ChatBot._clean_response(self._buf)
+        self._buf = ""
+        if not cleaned:
+            return []
+        self.sent += 1
+        return [cleaned]
+
+
 class ChatBot:
     def __init__(
             self,
             api_key: str = API_KEY,
             app_id: str = APP_ID,
-            system_prompt: str = SYS_PROMPT
+            system_prompt: str = SYS_PROMPT,
+            store: Optional[SessionStore] = None,
+            cache: Optional[ReplyCache] = None
     ) -> None:
         if not api_key or not app_id:
             raise ValueError("请先配置 API_KEY 和 APP_ID")
@@ -38,40 +419,66 @@ class ChatBot:
         self.app_id: str = app_id
         self.system_prompt: str = system_prompt
 
-        # 每个 user 的 session_id
-        self._session_table: Dict[str, str] = {}
+        # 每个 user 的 session_id 与对话历史
+        self.sessions: SessionStore = store if store is not None else SessionStore()
+        # 首轮 / 无状态提问的回答缓存
+        self.cache: ReplyCache = cache if cache is not None else ReplyCache()
 
     def add_user(self, user_name: str) -> None:
         """为新用户初始化对话历史"""
-        if user_name not in message_table:
-            message_table[user_name] = []
+        if self.sessions.add_user(user_name):
             logging.info(f"新用户加入：{user_name}")
 
     def add_history(self, user_name: str, role: str, content: Any) -> None:
-        """把一条消息追加到指定用户的历史里"""
-        if user_name in message_table:
-            message_table[user_name].append({"role": role, "content": content})
+        """把一条消息追加到指定用户的历史里（超出 HISTORY_MAX_LEN 时丢掉最早的）"""
+        self.sessions.add_history(user_name, role, content)
 
     @staticmethod
     def _clean_response(text: str) -> str:
         """清洗模型返回的文本，去除多余格式"""
-        text = re.sub(r"\[.*?\]", "", text, flags=re.DOTALL)
-        text = re.sub(r"\*\*\*|\*\*|\*", "", text)
-        text = re.sub(r"^[#\-\t]+", "", text, flags=re.MULTILINE)
-        text = re.sub(r"\n+", "\n", text)
-        text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
-        return text.strip()
+        with timed("clean_response"):
+            text = re.sub(r"\[.*?\]", "", text, flags=re.DOTALL)
+            text = re.sub(r"\*\*\*|\*\*|\*", "", text)
+            text = re.sub(r"^[#\-\t]+", "", text, flags=re.MULTILINE)
+            text = re.sub(r"\n+", "\n", text)
+            text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+            return text.strip()
 
     def reset_session(self, user: str) -> None:
         """清除某个 user 的会话，让下一次调用当作首次提问"""
-        self._session_table.pop(user, None)
+        self.sessions.reset(user)
         logging.info(f"会话已重置：{user}")
 
+    def _cache_key(self, user: str, prompt: str) -> Tuple[Optional[tuple], bool]:
+        """→ (缓存 key 或 None, 是否按无状态提问处理)"""
+        stateless = self.cache.is_stateless(prompt)
+        first_turn = self.sessions.session_id(user) is None
+        return self.cache.key(user, prompt, self.system_prompt, first_turn), stateless
+
     def chat(self, user: str, prompt: str) -> str:
         """
         向指定 user 提问，返回清洗后的文字答案并更新 session_id。
+        首轮或无状态提问先查回答缓存。
         """
-        sid: Optional[str] = self._session_table.get(user)
+        key, stateless = self._cache_key(user, prompt)
+        if key is None:
+            res = self._chat(user, prompt, stateless)
+            return "抱歉，调用出错，请稍后再试。" if res is None else res
+
+        def load() -> List[str]:
+            res = self._chat(user, prompt, stateless)
+            if not res:
+                raise _NotCached
+            return [res]
+
+        try:
+            return "\n".join(self.cache.load(key, load))
+        except _NotCached:
+            return "抱歉，调用出错，请稍后再试。"
+
+    def _chat(self, user: str, prompt: str, stateless: bool = False) -> Optional[str]:
+        """真正调用接口；失败返回 None。stateless 时不带也不更新 session_id"""
+        sid: Optional[str] = None if stateless else self.sessions.session_id(user)
 
         if sid is None:
             full_prompt = f"{self.system_prompt}\n\n{prompt}"
@@ -81,6 +488,7 @@ class ChatBot:
         logging.info(f"→ 请求文字 user={user}, session_id={sid}:\n{full_prompt}")
 
         try:
+            _load_dashscope()
             resp = Application.call(
                 api_key=self.api_key,
                 app_id=self.app_id,
@@ -89,21 +497,104 @@ class ChatBot:
             )
         except Exception:
             logging.exception("API 调用异常")
-            return "抱歉，调用出错，请稍后再试。"
+            return None
 
         if resp.status_code != HTTPStatus.OK:
             logging.error(
                 "调用失败 code=%s request_id=%s message=%s",
                 resp.status_code, resp.request_id, resp.message
             )
-            return "抱歉，调用出错，请稍后再试。"
+            return None
 
         raw = resp.output.text or ""
         cleaned = self._clean_response(raw)
-        self._session_table[user] = resp.output.session_id
+        if not stateless:
+            self.sessions.set_session_id(user, resp.output.session_id)
         logging.info(f"← 响应文字 user={user}, new_session_id={resp.output.session_id}:\n{cleaned}")
         return cleaned
 
+    def chat_stream(
+            self,
+            user: str,
+            prompt: str,
+            min_chunk: int = STREAM_MIN_CHUNK,
+            max_msgs: int = STREAM_MAX_MSGS
+    ) -> Iterator[str]:
+        """
+        流式版 chat：用 DashScope 增量输出，按句子边界逐段产出清洗后的文字，
+        第一句凑够 min_chunk 字就可以先发；最多产出 max_msgs 段。
+        首轮或无状态提问命中缓存时直接产出缓存的各段。
+        """
+        key, stateless = self._cache_key(user, prompt)
+        leader = False
+        if key is not None:
+            cached, leader = self.cache.claim(key)
+            if cached is not None:
+                logging.info(f"← 缓存命中 user={user}: {prompt}")
+                yield from cached
+                return
+
+        parts: List[str] = []
+        ok = False
+        try:
+            ok = yield from self._stream(user, prompt, stateless, parts, min_chunk, max_msgs)
+        finally:
+            if leader:                     # 提前关掉生成器时也要放行等同一问题的线程
+                self.cache.release(key, parts if ok else None)
+
+    def _stream(
+            self,
+            user: str,
+            prompt: str,
+            stateless: bool,
+            parts: List[str],
+            min_chunk: int,
+            max_msgs: int
+    ) -> Generator[str, None, bool]:
+        """chat_stream 的接口调用部分：产出的各段同时追加到 parts；返回是否完整成功（可以写缓存）"""
+        sid: Optional[str] = None if stateless else self.sessions.session_id(user)
+        full_prompt = f"{self.system_prompt}\n\n{prompt}" if sid is None else prompt
+        logging.info(f"→ 请求文字(流式) user={user}, session_id={sid}:\n{full_prompt}")
+
+        splitter = _SentenceSplitter(min_chunk, max_msgs)
+        new_sid: Optional[str] = None
+        ok = True
+        try:
+            _load_dashscope()
+            for resp in Application.call(
+                    api_key=self.api_key,
+                    app_id=self.app_id,
+                    prompt=full_prompt,
+                    session_id=sid,
+                    stream=True,
+                    incremental_output=True
+            ):
+                if resp.status_code != HTTPStatus.OK:
+                    logging.error(
+                        "调用失败 code=%s request_id=%s message=%s",
+                        resp.status_code, resp.request_id, resp.message
+                    )
+                    ok = False
+                    break
+                new_sid = resp.output.session_id or new_sid
+                for part in splitter.feed(resp.output.text or ""):
+                    parts.append(part)
+                    yield part
+        except Exception:
+            ok = False
+            logging.exception("API 调用异常")
+
+        for part in splitter.flush():
+            parts.append(part)
+            yield part
+        if not parts:
+            yield "抱歉，调用出错，请稍后再试。"
+            return False
+        if new_sid and not stateless:
+            self.sessions.set_session_id(user, new_sid)
+        logging.info(f"← 响应文字(流式) user={user}, new_session_id={new_sid}, {len(parts)} 段:\n" + "\n".join(parts))
+        return ok
+
     def chat_multimodal(self, user: str, messages: List[Dict[str, Any]]) -> str:
         """
         向指定 user 发送多模态消息（文字 + 图片）。
@@ -117,6 +608,7 @@ class ChatBot:
         logging.info(f"→ 请求多模态 user={user}, messages={messages}")
 
         try:
+            _load_dashscope()
             resp = MultiModalConversation.call(
                 api_key=self.api_key,
                 model='qwen-vl-max-latest',
@@ -153,6 +645,11 @@ def chat(user: str, prompt: str) -> str:
     return _bot.chat(user, prompt)
 
 
+def chat_stream(user: str, prompt: str) -> Iterator[str]:
+    """流式：for part in ai.chat_stream('alice', '你好'): chat.SendMsg(part) """
+    return _bot.chat_stream(user, prompt)
+
+
 def chat_multimodal(user: str, messages: List[Dict[str, Any]]) -> str:
     """在 app.py 里直接调用多模态： reply = ai.chat_multimodal('alice', messages) """
     return _bot.chat_multimodal(user, messages)
@@ -161,3 +658,18 @@ def chat_multimodal(user: str, messages: List[Dict[str, Any]]) -> str:
 def reset_session(user: str) -> None:
     """在需要时清除某用户会话历史"""
     _bot.reset_session(user)
+
+
+def session_stats() -> Dict[str, int]:
+    """会话表规模：用户数、历史条数、估算内存等"""
+    return _bot.sessions.stats()
+
+
+def cache_stats() -> Dict[str, Any]:
+    """回答缓存：命中 / 未命中 / 命中率 / 绕过次数"""
+    return _bot.cache.stats()
+
+
+def set_cache_opt_out(user: str, opt_out: bool = True) -> None:
+    """某个会话不想要缓存的回答时调用：ai.set_cache_opt_out('某群')"""
+    _bot.cache.set_opt_out(user, opt_out)
@@ -7,48 +7,134 @@ Selenium-Only 12306 WeChat Bot · 2025-07-03
 • ✅ 浏览器常驻复用    • UI 主题 ttk（自定义）
 ————————————————————————————————————————————
 依赖：pip install wxauto selenium webdriver-manager pillow
+  python app.py                 图形界面
+  python app.py --headless      无界面常驻：读 settings.json，日志写 bot.log
+  python app.py --record cap.jsonl.gz   录制收发消息（可与 --headless 同用），bench/e2e.py --replay 回放
 """
 
-import os, sys, json, queue, time, threading, traceback, ai
+import time; _T0=time.perf_counter()      # 启动耗时从这里算起
+import os, re, sys, json, queue, signal, logging, argparse, threading, traceback, ai
+from dispatch import Dispatcher
+from cache import TTLCache, SqliteCache
+from stations import StationIndex
+from rules import KeywordRules
+from imgprep import ImagePrep
+from metrics import metrics, timed, inc
+from watch import WatchScheduler
+from tickets import Trains, Pager, parse_filters, seat_name
+from outbox import Outbox, PRIO_HIGH, PRIO_NORMAL, PRIO_LOW
+from logsink import LogSink
+from poller import AdaptivePoller
+from capture import Recorder
+from transfer import pick_hubs, overnight, connect, render as render_transfer
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
-import urllib3
-from wxauto import WeChat
+# wxauto / PIL / urllib3 / selenium / dashscope 导入都偏慢，用到时再导入
 import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.scrolledtext import ScrolledText
-from PIL import Image, ImageTk          # ← 新增
 
 # ——— 常量 ——— #
 APP_NAME        = "微信 AI Bot"
 BASE_DIR      = Path(sys.executable).parent if getattr(sys, 'frozen', False) else Path(__file__).parent
 SETTINGS_FILE = BASE_DIR / "settings.json"
+LOG_FILE      = BASE_DIR / "bot.log"          # 日志文件（界面 / 无界面共用），按大小滚动
 
 STATION_FILE    = BASE_DIR / ".1.json"
+STATION_CACHE   = BASE_DIR / ".stations.bin"    # .1.json 的编译缓存，源文件变动时自动重建
 BACKGROUND      = BASE_DIR / "background.png"       # ← 背景 PNG，None=不启用
 HEADLESS        = True
 LOG_TRIM_LINES  = 4_000
+LOG_TRIM_CHUNK  = 500      # 超出 LOG_TRIM_LINES 这么多行才裁一次，一次裁到 LOG_TRIM_LINES
+LOG_FRAME_LINES = 200      # 日志面板每帧最多渲染几行，积压更多时只显示最新的
+LOG_LINE_CHARS  = 500      # 面板里单行最多显示几个字（完整内容在日志文件里）
+LOG_UI_BUFFER   = 2_000    # 面板来不及渲染时最多积压几行
+LOG_FILE_MAX    = 5 << 20  # 日志文件滚动大小（字节）
+LOG_FILE_BACKUPS = 3       # 保留几个旧日志文件
 IMAGE_TIMEOUT   = 10       # s
-WAIT_INTERVAL   = 0.1      # s
+IMAGE_MAX_SIDE  = 1280     # px，多模态上传前缩放到的最长边
+IMAGE_QUALITY   = 85       # JPEG 重新压缩质量
+IMAGE_CACHE_DIR = BASE_DIR / ".imgcache"   # 处理结果按内容哈希存放
+IMAGE_CACHE_MAX = 200      # 最多保留的处理结果数
+METRICS_FILE     = BASE_DIR / "metrics.prom"   # Prometheus 文本格式，定期重写
+METRICS_INTERVAL = 15      # s
+METRICS_UI_INTERVAL = 2    # s，界面上的 gauge 多久在后台重算一次
+WAIT_INTERVAL   = 0.1      # s，有消息往来时的轮询间隔
+POLL_BURST      = 0.02     # s，刚拉到消息后下一次轮询的间隔
+POLL_IDLE_MAX   = 1.0      # s，长时间没有消息时放宽到的轮询间隔
+POLL_IDLE_AFTER = 10       # 连续这么多次空轮询后开始放宽
+RECORD_FILE     = os.getenv("WXBOT_RECORD")   # 设置后把收发消息录制到该文件（.jsonl.gz），供 bench/e2e.py --replay 回放
 CHROME_BINARY   = None
+TICKET_BASE_URL = os.getenv("TICKET_BASE_URL", "https://kyfw.12306.cn")  # 可指向本地桩服务
+HTTP_FASTPATH   = True     # 先用 HTTP 直连查询，被拦截再回退浏览器
+HTTP_TIMEOUT    = 5        # s
+CHROME_POOL_SIZE   = 2        # 常驻浏览器数量
+CHROME_MAX_USES    = 200      # 单个浏览器查询多少次后重建
+CHROME_HEALTH_IDLE = 30       # s，闲置超过该时长，借出前先做健康检查
+QUERY_TIMEOUT      = 15       # s，等待空闲浏览器 / 页面加载的上限
+DISPATCH_WORKERS     = 4      # 并行处理的会话数
+DISPATCH_PER_CHAT    = 32     # 单个会话最多排队条数（超出丢弃）
+DISPATCH_MAX_PENDING = 256    # 全局在途上限（超出时轮询线程等待）
+TICKET_CACHE_TTL     = 60     # s，余票结果缓存时长
+TICKET_CACHE_SIZE    = 512    # 最多缓存的 (出发, 到达, 日期) 组合数
+SHARED_CACHE_FILE    = BASE_DIR / ".cache.sqlite3"   # 多个 app.py 进程共用的余票缓存，重启后仍有效；None=不启用
+SHARED_CACHE_MAX     = 64 << 20   # 字节，共享缓存总大小上限
+SHARED_MEM_TTL       = 10     # s，启用共享缓存时进程内缓存只留这么久，过期后回共享缓存取（新鲜度以它为准）
+AI_STREAM            = True   # AI 回复按句流式发送（首句先发）
+BATCH_CONCURRENCY    = 4      # 一次“车票”命令拆出的多个查询的并发上限（全局共用）
+BATCH_MAX_QUERIES    = 12     # 单条命令最多拆成多少个 (出发, 到达, 日期) 查询
+BATCH_MAX_DAYS       = 7      # 日期范围最多几天
+TICKET_PAGE_DETAIL   = 8      # 单线路回复每页几趟车（每趟两行）
+TICKET_PAGE_LINES    = 20     # 多线路 / 多日期回复每页几趟车（每趟一行）
+TICKET_PAGE_TTL      = 600    # s，“下一页”可翻的时限
+TRANSFER_HUBS        = ("郑州东", "武汉", "南京南", "长沙南", "西安北", "济南西", "徐州东", "合肥南", "杭州东",
+                        "成都东", "重庆北", "贵阳北", "广州南", "北京南", "上海虹桥", "天津西", "石家庄", "南昌西",
+                        "昆明南", "沈阳北", "福州", "兰州西", "太原南")   # 换乘候选枢纽，按顺序试前 TRANSFER_MAX_HUBS 个
+TRANSFER_MAX_HUBS    = 4      # 一次换乘搜索最多试几个中转站（每个站查两段）
+TRANSFER_MIN_CONN    = 20     # 分钟，同站换乘至少留的时间
+TRANSFER_MAX_WAIT    = 240    # 分钟，中转最多等多久
+TRANSFER_TOP         = 5      # 最多给出几个方案
+WATCH_FILE           = BASE_DIR / "watches.json"   # 盯票订阅，重启后继续
+WATCH_BUDGET         = 20     # 盯票每分钟最多查询次数（所有订阅合计）
+WATCH_MIN_INTERVAL   = 60     # s，同一线路+日期两次查询的最短间隔
+WATCH_MAX_INTERVAL   = 900    # s，长期无变化时放宽到的最长间隔
+WATCH_PER_CHAT       = 10     # 每个会话最多盯几个
+SEND_RATE            = 5      # 条/秒，所有会话合计的发送速率
+SEND_BURST           = 10
+SEND_CHAT_RATE       = 1      # 条/秒，单个会话的发送速率
+SEND_CHAT_BURST      = 3
+SEND_MERGE_CHARS     = 800    # 同一会话排队中的回复合并成一条的字数上限
+SEND_DRAIN           = 3      # s，点“停止”时最多再等多久把排队的回复发完
+DISPATCH_STOP_WAIT   = 2      # s，点“停止”时最多等多久让正在处理的消息把回复交给发送队列
 
 # ——— 环境初始化 ——— #
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-sys.stdout.reconfigure(encoding="utf-8")
+if sys.stdout: sys.stdout.reconfigure(encoding="utf-8")    # pythonw 下没有 stdout
 
 # ——— 站点码表 ——— #
-with open(STATION_FILE, encoding="utf-8") as f:
-    _station_map = {i["station_name"]: i["station_telecode"]
-                    for i in json.load(f).get("Sheet1", [])}
+_stations = StationIndex.load(STATION_FILE, STATION_CACHE)
+
 def get_station_code(name: str) -> str:
-    return _station_map.get(name, "")
+    """站名 / 全拼 / 简拼 / 电报码 → 电报码，找不到返回空串"""
+    with timed("station"):
+        return _stations.code(name)
+
+def _station_miss(*names: str) -> str:
+    """“未找到站名” 回复，附带候选站名"""
+    lines = [f"❌ 未找到站名 {'/'.join(names)}"]
+    for n in names:
+        if get_station_code(n): continue
+        with timed("station"):
+            sug = _stations.suggest(n)
+        if sug: lines.append(f"“{n}” 是不是：{' / '.join(s.name for s in sug)}")
+    return "\n".join(lines)
 
-# ————————————————— Selenium 单例 ————————————————— #
+# ————————————————— Selenium 浏览器池 ————————————————— #
 class _Chrome:
-    """用一次取一次，cookie 自动保持。_Chrome.get().fetch_json(...) → dict"""
-    _inst: Optional["_Chrome"] = None
+    """单个浏览器，cookie 自动保持；只能由一个线程使用，统一经 _chromes.lease() 借还"""
     def __init__(self):
         from selenium import webdriver
         from selenium.webdriver.chrome.service import Service
@@ -72,18 +158,23 @@ class _Chrome:
             service=Service(ChromeDriverManager().install()),
             options=opts
         )
-        self._drv.set_page_load_timeout(15)
-        self._drv.get("https://kyfw.12306.cn/otn/leftTicket/init")  # 建立 cookie
+        self._drv.set_page_load_timeout(QUERY_TIMEOUT)
+        self._drv.set_script_timeout(QUERY_TIMEOUT)
+        self._drv.get(f"{TICKET_BASE_URL}/otn/leftTicket/init")  # 建立 cookie
+        self.uses = 0
+        self.last_used = time.monotonic()
 
-    @classmethod
-    def get(cls) -> "_Chrome":
-        if cls._inst is None:
-            cls._inst = _Chrome()
-        return cls._inst
+    def healthy(self) -> bool:
+        try:
+            self._drv.execute_script("return 1")
+            return True
+        except Exception:
+            return False
 
     def fetch_json(self, dep: str, arr: str, date: str) -> dict:
         from selenium.webdriver.common.by import By
-        url = ( "https://kyfw.12306.cn/otn/leftTicket/query?"
+        self.uses += 1
+        url = ( f"{TICKET_BASE_URL}/otn/leftTicket/query?"
                 f"leftTicketDTO.train_date={date}"
                 f"&leftTicketDTO.from_station={dep}"
                 f"&leftTicketDTO.to_station={arr}&purpose_codes=ADULT" )
@@ -91,52 +182,396 @@ class _Chrome:
         body = self._drv.find_element(By.TAG_NAME, "body").text
         return json.loads(body)
 
+    def cookies(self) -> Dict[str, str]:
+        return {c["name"]: c["value"] for c in self._drv.get_cookies()}
+
+    def user_agent(self) -> str:
+        return self._drv.execute_script("return navigator.userAgent")
+
     def quit(self):
         try: self._drv.quit()
         except Exception: pass
 
+class _ChromePool:
+    """
+    N 个常驻浏览器的借还池：
+    • checkout 优先取最近用过的空闲实例，不足 N 个时现建，否则最多等 timeout 秒
+    • 出错 / 用满 CHROME_MAX_USES 次 / 健康检查失败的实例直接销毁，后台补一个新的
+    """
+    def __init__(self, size:int):
+        self.size = size
+        self._idle: "queue.LifoQueue[_Chrome]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._count = 0            # 已创建且未销毁（含借出）的实例数
+        self._closed = False
+        self.created = self.recycled = 0
+
+    def _spawn(self) -> Optional[_Chrome]:
+        with self._lock:
+            if self._closed or self._count >= self.size: return None
+            self._count += 1
+        try:
+            c = _Chrome()
+        except Exception:
+            with self._lock: self._count -= 1
+            raise
+        with self._lock: self.created += 1
+        return c
+
+    def _discard(self, c:_Chrome):
+        c.quit()
+        with self._lock:
+            self._count -= 1
+            self.recycled += 1
+
+    def checkout(self, timeout:float=QUERY_TIMEOUT) -> _Chrome:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                c = self._idle.get_nowait()
+            except queue.Empty:
+                c = self._spawn()
+                if c is None:
+                    left = deadline - time.monotonic()
+                    if left <= 0: raise TimeoutError("浏览器全部繁忙，请稍后再试")
+                    try: c = self._idle.get(timeout=min(left, 0.5))   # 分段等，期间可能有名额空出来
+                    except queue.Empty: continue
+            if time.monotonic() - c.last_used > CHROME_HEALTH_IDLE and not c.healthy():
+                self._discard(c); continue
+            return c
+
+    def checkin(self, c:_Chrome, ok:bool=True):
+        c.last_used = time.monotonic()
+        if ok and not self._closed and c.uses < CHROME_MAX_USES:
+            self._idle.put(c); return
+        self._discard(c)
+        if not self._closed: self.warmup()
+
+    @contextmanager
+    def lease(self, timeout:float=QUERY_TIMEOUT):
+        c = self.checkout(timeout); ok = False
+        try:
+            yield c; ok = True
+        finally:
+            self.checkin(c, ok)
+
+    def warmup(self):
+        """后台把池子补满"""
+        def run():
+            while True:
+                try:
+                    c = self._spawn()
+                except Exception as e:
+                    logging.getLogger("wxbot").warning("⚠️ 浏览器预热失败：%s", e); return   # 界面 / 无界面都落到 bot.log
+                if c is None: return
+                self._idle.put(c)
+        threading.Thread(target=run, daemon=True).start()
+
+    def close(self):
+        with self._lock: self._closed = True
+        while True:
+            try: self._discard(self._idle.get_nowait())
+            except queue.Empty: break
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self.size, "alive": self._count, "idle": self._idle.qsize(),
+                "created": self.created, "recycled": self.recycled}
+
+_chromes = _ChromePool(CHROME_POOL_SIZE)
+
+# ————————————————— HTTP 直连（复用浏览器 cookie） ————————————————— #
+class _Blocked(Exception):
+    """直连请求被 12306 反爬拦截（跳转 / 非 JSON / status=false）"""
+
+class _Http:
+    """keep-alive 连接池直连 leftTicket/query；cookie 从 _Chrome 会话里拿"""
+    def __init__(self):
+        self._pool = None
+        self._lock = threading.Lock()
+        self._cookies: Dict[str, str] = {}
+        self._ua = ""
+        self.fast = self.blocked = 0
+
+    def harvest(self, chrome:"_Chrome"):
+        """从浏览器同步 cookie 与 UA"""
+        cookies, ua = chrome.cookies(), chrome.user_agent()
+        with self._lock:
+            self._cookies, self._ua = cookies, ua
+
+    def _headers(self) -> Dict[str, str]:
+        with self._lock:
+            return {
+                "Cookie": "; ".join(f"{k}={v}" for k, v in self._cookies.items()),
+                "User-Agent": self._ua,
+                "Referer": f"{TICKET_BASE_URL}/otn/leftTicket/init",
+                "Accept": "application/json, text/javascript, */*; q=0.01",
+                "X-Requested-With": "XMLHttpRequest",
+            }
+
+    def _merge_set_cookie(self, resp):
+        from http.cookies import SimpleCookie
+        for raw in resp.headers.get_all("Set-Cookie") or []:
+            jar = SimpleCookie(); jar.load(raw)
+            with self._lock:
+                self._cookies.update({k: m.value for k, m in jar.items()})
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                import urllib3
+                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+                self._pool = urllib3.PoolManager(num_pools=2, maxsize=8, block=False,
+                                                 cert_reqs="CERT_NONE", retries=False,
+                                                 timeout=urllib3.Timeout(total=HTTP_TIMEOUT))
+            return self._pool
+
+    def fetch_json(self, dep: str, arr: str, date: str) -> dict:
+        import urllib3
+        pool = self._get_pool()
+        if not self._cookies:
+            with _chromes.lease() as chrome: self.harvest(chrome)
+        try:
+            resp = pool.request(
+                "GET", f"{TICKET_BASE_URL}/otn/leftTicket/query",
+                fields={"leftTicketDTO.train_date": date,
+                        "leftTicketDTO.from_station": dep,
+                        "leftTicketDTO.to_station": arr,
+                        "purpose_codes": "ADULT"},
+                headers=self._headers(), redirect=False)
+        except urllib3.exceptions.HTTPError as e:
+            raise _Blocked(f"网络异常：{e}") from e
+        if resp.status != 200:
+            raise _Blocked(f"HTTP {resp.status}")
+        try:
+            data = json.loads(resp.data.decode("utf-8"))
+        except ValueError:
+            raise _Blocked("响应不是 JSON") from None
+        if not data.get("status", True) or not isinstance(data.get("data"), dict):
+            raise _Blocked(f"status=false {data.get('messages')}")
+        self._merge_set_cookie(resp)
+        self.fast += 1
+        return data
+
+_http = _Http()
+
+def _fetch_direct(dep:str, arr:str, date:str)->dict:
+    """直连优先；被拦截或网络异常时走浏览器，并用浏览器新 cookie 刷新直连会话"""
+    if HTTP_FASTPATH:
+        try:
+            with timed("fetch_http"):
+                return _http.fetch_json(dep, arr, date)
+        except _Blocked:
+            _http.blocked += 1
+    with timed("fetch_browser"), _chromes.lease() as chrome:
+        data = chrome.fetch_json(dep, arr, date)
+        if HTTP_FASTPATH:
+            try: _http.harvest(chrome)
+            except Exception: pass
+    return data
+
 # —————————————— 业务函数（与 UI 无关） —————————————— #
+# (出发码, 到达码, 日期) → 12306 JSON；相同查询并发时只发一次请求
+# 两级：进程内 TTLCache（合并本进程的并发请求）→ 共享的 SqliteCache（合并各进程的请求）→ 直连 / 浏览器
+_shared = SqliteCache(SHARED_CACHE_FILE, ttl=TICKET_CACHE_TTL, max_bytes=SHARED_CACHE_MAX,
+                      namespace="leftTicket") if SHARED_CACHE_FILE else None
+_ticket_cache = TTLCache(ttl=min(TICKET_CACHE_TTL, SHARED_MEM_TTL) if _shared else TICKET_CACHE_TTL,
+                         maxsize=TICKET_CACHE_SIZE)
+
+def _load_ticket(dep:str, arr:str, date:str)->dict:
+    if _shared is None: return _fetch_direct(dep, arr, date)
+    return _shared.get_or_load(f"{dep}|{arr}|{date}", lambda: _fetch_direct(dep, arr, date))
+
 def _fetch(dep:str, arr:str, date:str)->dict:
-    return _Chrome.get().fetch_json(dep, arr, date)
+    with timed("fetch"):
+        return _ticket_cache.get_or_load((dep, arr, date), lambda: _load_ticket(dep, arr, date))
 
-def query_all_tickets(dep:str, arr:str)->str:
-    dep_c, arr_c = get_station_code(dep), get_station_code(arr)
-    if not dep_c or not arr_c:
-        return f"❌ 未找到站名 {dep}/{arr}"
-    date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+def ticket_cache_stats()->Dict[str,Any]:
+    return {**_ticket_cache.stats(), "shared": _shared.stats() if _shared else None,
+            "http_fast": _http.fast, "http_blocked": _http.blocked, "chrome": _chromes.stats()}
+
+metrics.gauges(lambda: {f"ticket_cache_{k}": v for k, v in _ticket_cache.stats().items()})
+metrics.gauges(lambda: {f"shared_cache_{k}": v for k, v in _shared.stats().items()} if _shared else {})
+metrics.gauges(lambda: {f"chrome_{k}": v for k, v in _chromes.stats().items()})
+metrics.gauges(lambda: {f"ai_sessions_{k}": v for k, v in ai.session_stats().items()})
+
+_DATE_RE = re.compile(r"^(?:(\d{4})[-/.年])?(\d{1,2})[-/.月](\d{1,2})日?$")
+
+def parse_date(tok:str)->Optional[str]:
+    """今天 / 明天 / 后天 / 10-20 / 10月20日 / 2025-10-20 → YYYY-MM-DD；不是日期返回 None"""
+    today=datetime.now().date()
+    rel={"今天":0,"明天":1,"后天":2}.get(tok)
+    if rel is not None: return (today+timedelta(days=rel)).isoformat()
+    m=_DATE_RE.match(tok)
+    if not m: return None
+    y,mo,d=m.groups()
     try:
-        data = _fetch(dep_c, arr_c, date)
-    except Exception as e:
-        return f"⚠️ 查询失败：{e}"
-    res, mp = data["data"]["result"], data["data"]["map"]
-    if not res: return "🚫 暂无余票"
+        dt=datetime(int(y) if y else today.year, int(mo), int(d)).date()
+    except ValueError:
+        return None
+    if not y and dt<today: dt=dt.replace(year=today.year+1)   # 只写月日且已过 → 明年
+    return dt.isoformat()
 
-    def fmt(r:str):
-        p=r.split("|")
-        return (f"🚄{p[3]} {mp.get(p[6],p[6])}->{mp.get(p[7],p[7])} "
-                f"{p[8]}-{p[9]} 历时{p[10]}\n"
-                f"商:{p[32]} ①:{p[31]} ②:{p[30]} 软:{p[23]} "
-                f"硬卧:{p[28]} 硬座:{p[29]} 无座:{p[26]}")
-    return "\n\n".join(map(fmt, res))
+def parse_dates(tok:str)->Optional[List[str]]:
+    """单个日期，或 10-20~10-22 / 10-20到10-22 / 3天（明天起连续 3 天）→ 日期列表；不是日期返回 None"""
+    m=re.fullmatch(r"(\d{1,2})天", tok)
+    if m:
+        start=datetime.now().date()+timedelta(days=1); n=int(m.group(1))
+    else:
+        parts=re.split(r"~|～|到|至", tok, maxsplit=1)
+        days=[parse_date(x) for x in parts]
+        if None in days: return None
+        if len(days)==1: return days
+        start=datetime.fromisoformat(days[0]).date()
+        n=(datetime.fromisoformat(days[1]).date()-start).days+1
+    if n<1: return None
+    return [(start+timedelta(days=i)).isoformat() for i in range(min(n, BATCH_MAX_DAYS))]
+
+def _expand(names:str, missed:List[str])->List[Any]:
+    """“上海/上海虹桥”“上海*” → 车站列表（去重保序）；查不到的名字追加到 missed"""
+    out={}
+    for n in names.split("/"):
+        with timed("station"): hits=_stations.expand(n)
+        if not hits: missed.append(n.rstrip("*"))
+        out.update((s.telecode,s) for s in hits)
+    return list(out.values())
+
+def _fetch_many(jobs:List[tuple])->List[Any]:
+    """并发查询多个 (出发码, 到达码, 日期)，并发度受 _batch_pool 限制；失败的位置放异常对象"""
+    futs=[_batch_pool.submit(_fetch,*j) for j in jobs]
+    out=[]
+    for f in futs:
+        try: out.append(f.result(timeout=QUERY_TIMEOUT*2))
+        except Exception as e: out.append(e)
+    return out
+
+_batch_pool = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch")
+_pager = Pager(ttl=TICKET_PAGE_TTL)
+
+def query_all_tickets(dep:str, arr:str, *opts:str, who:str="")->str:
+    """
+    出发 / 到达可写多个站（“上海/上海虹桥”）或同名前缀（“上海*”）；opts 依次可含：
+    日期或日期范围（默认明天）、车型（G / GD / 高铁）、出发时间窗（8-12点）、有票 / 席别、排序（按历时）。
+    所有 (出发, 到达, 日期) 组合并发查询，合并去重后筛选排序；超过一页的部分存进 _pager，回复“下一页”翻看。
+    """
+    missed = []
+    deps, arrs = _expand(dep, missed), _expand(arr, missed)
+    if missed:
+        return _station_miss(*missed)
+    when, rest = None, []
+    for tok in opts:
+        if when is None and parse_dates(tok): when = tok
+        else: rest.append(tok)
+    filters, unknown = parse_filters(rest)
+    if unknown:
+        return f"❌ 看不懂“{' '.join(unknown)}”，例如：车票 上海 南京 10-20~10-22 G 8-12点 有票 按历时"
+    dates = parse_dates(when) if when else [(datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")]
+    jobs = [(d.telecode, a.telecode, dt) for dt in dates for d in deps for a in arrs if d.telecode != a.telecode]
+    if not jobs: return "❌ 出发站和到达站相同"
+    warn = [f"⚠️ 组合太多，只查了前 {BATCH_MAX_QUERIES}/{len(jobs)} 个"] if len(jobs) > BATCH_MAX_QUERIES else []
+    jobs = jobs[:BATCH_MAX_QUERIES]
+
+    trains, failed = Trains(), []
+    with timed("batch"):
+        results = _fetch_many(jobs)
+    with timed("parse"):
+        for (_, _, dt), data in zip(jobs, results):
+            if isinstance(data, Exception): failed.append(data); continue
+            trains.add_result(data, dt)     # 同城车站的查询会返回重叠车次，按 (日期, 车次, 上下车站) 去重
+    if not len(trains):
+        return f"⚠️ 查询失败：{failed[0]}" if failed else f"🚫 暂无余票（没有直达车可以试试：换乘 {dep} {arr}）"
+    if failed: warn.append(f"⚠️ {len(failed)}/{len(jobs)} 个查询失败，结果可能不全")
+
+    # 单一线路沿用两行的完整格式；多线路 / 多日期一趟一行，默认只列有票的车
+    detail = len(jobs) == 1
+    if not detail: filters.setdefault("has_seats", True)
+    idx = trains.select(**filters)
+    span = dates[0] if len(dates) == 1 else f"{dates[0]}~{dates[-1]}"
+    header = "\n".join(warn + [f"🚄 {dep}→{arr} {span} {len(idx)}/{len(trains)} 趟"])
+    if not idx:
+        return header + "\n🚫 没有符合条件的车次"
+    pages = trains.render(idx, detail, TICKET_PAGE_DETAIL if detail else TICKET_PAGE_LINES)
+    return _pager.start(who, header, pages)
+
+def query_transfer(dep:str, arr:str, *opts:str)->str:
+    """
+    换乘 上海 大理 [日期] [车型 / 出发时段 / 席别]：一次中转的方案，按全程时长排序，两段都要有票。
+    出发时段只约束第一段；两段查询与“车票”共用 _fetch 缓存，短时间内重复搜索几乎不花时间。
+    """
+    with timed("station"):
+        d, a = _stations.find(dep), _stations.find(arr)
+    if not d or not a:
+        return _station_miss(*(n for n, s in ((dep, d), (arr, a)) if not s))
+    date, rest = None, []
+    for tok in opts:
+        if date is None and parse_date(tok): date = parse_date(tok)
+        else: rest.append(tok)
+    filters, unknown = parse_filters(rest)
+    if unknown:
+        return f"❌ 看不懂“{' '.join(unknown)}”，例如：换乘 上海 大理 10-20 G 8-12点 二等"
+    date = date or (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    with timed("station"):
+        hubs = pick_hubs(_stations, d, a, TRANSFER_HUBS, TRANSFER_MAX_HUBS)
+    if not hubs: return "🚫 没有合适的中转站"
+
+    jobs = [(d.telecode, h.telecode, date) for h in hubs] + [(h.telecode, a.telecode, date) for h in hubs]
+    with timed("transfer_fetch"):
+        results = _fetch_many(jobs)
+    first, second, failed = Trains(), Trains(), 0
+    with timed("transfer_join"):
+        for k, data in enumerate(results):
+            if isinstance(data, Exception): failed += 1; continue
+            (first if k < len(hubs) else second).add_result(data, date)
+        seats, types = filters.get("seats", ()), filters.get("types", "")
+        i1 = first.select(types=types, after=filters.get("after", 0), before=filters.get("before", 24*60),
+                          has_seats=True, seats=seats)
+    # 第一段过夜到站、或等车会等到次日的中转城市，第二段再查一次次日
+    with timed("station"):
+        late = {s.province for s in map(_stations.by_telecode, overnight(first, i1, TRANSFER_MAX_WAIT)) if s}
+    nxt = (datetime.fromisoformat(date) + timedelta(days=1)).strftime("%Y-%m-%d")
+    extra = [(h.telecode, a.telecode, nxt) for h in hubs if h.province in late]
+    later = []
+    if extra:
+        with timed("transfer_fetch"):
+            later = _fetch_many(extra)
+        jobs += extra
+    with timed("transfer_join"):
+        for data in later:
+            if isinstance(data, Exception): failed += 1; continue
+            second.add_result(data, nxt)
+        i2 = second.select(types=types, has_seats=True, seats=seats)
+        plans = connect(first, second, i1, i2, TRANSFER_MIN_CONN, TRANSFER_MAX_WAIT, seats, TRANSFER_TOP)
+    warn = [f"⚠️ {failed}/{len(jobs)} 段查询失败，结果可能不全"] if failed else []
+    header = "\n".join(warn + [f"🔁 {dep}→{arr} {date} 换乘（试了 {' / '.join(h.name for h in hubs)}）"])
+    if not plans:
+        return header + "\n🚫 没有能衔接上的有票车次"
+    return "\n".join([header] + render_transfer(first, second, plans))
+
+def next_page(who:str)->Optional[str]:
+    return _pager.next(who)
 
 def query_schedule(code:str, dep:str, arr:str)->str:
     dep_c, arr_c = get_station_code(dep), get_station_code(arr)
     if not dep_c or not arr_c:
-        return f"❌ 未找到站名 {dep}/{arr}"
+        return _station_miss(dep, arr)
     date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
     try:
         data = _fetch(dep_c, arr_c, date)
     except Exception as e:
         return f"⚠️ 查询失败：{e}"
-    for r in data["data"]["result"]:
-        p=r.split("|")
-        if p[3].upper()==code.upper():
-            return (f"🚅{p[3]} {dep}->{arr}\n"
-                    f"开 {p[8]}  到 {p[9]}  历时 {p[10]}")
-    return f"🚫 未找到车次 {code}"
+    t = Trains.parse(data, date)
+    i = t.find(code)
+    if i is None:
+        return f"🚫 未找到车次 {code}"
+    d = t.dur[i]
+    return (f"🚅{t.code[i]} {dep}->{arr}\n"
+            f"开 {t.start[i]}  到 {t.arrive[i]}  历时 {d // 60:02d}:{d % 60:02d}")
 
 query_tickets = query_schedule  # 兼容旧接口
 
+def _watch_fetch(dep_c:str, arr_c:str, date:str)->dict:
+    with timed("watch_poll"):
+        return _fetch(dep_c, arr_c, date)
+
 # ———————————————— Tk 组件增强 ———————————————— #
 class PlaceholderEntry(ttk.Entry):
     """灰色占位文本（FocusIn 自动清空）"""
@@ -158,14 +593,294 @@ class PlaceholderEntry(ttk.Entry):
             self.delete(0,"end")
             self.configure(foreground=self._default_fg)
 
-# ——————————————— 主应用 ——————————————— #
-class WeChatBotApp:
-    def __init__(self):
+class _NamedChat:
+    """只知道会话名时的发送对象（wx.SendMsg(who=...)），接口同 wxauto 聊天对象"""
+    def __init__(self, wx, who:str):
+        self.wx, self.who = wx, who
+    def SendMsg(self, msg:str):
+        self.wx.SendMsg(msg, who=self.who)
+
+# ——————————————— 消息处理核心（无 UI） ——————————————— #
+class BotCore:
+    """轮询 → 分发 → 处理 → 回复；不依赖 Tk，界面与基准测试共用"""
+    def __init__(self, sink:Optional[LogSink]=None):
         self.wx=None; self.running=False
+        self.sink=sink or LogSink()
         self.listen_list=[]; self.mapping_list=[]
+        self.rules=KeywordRules()            # mapping_list 的编译索引，两者同步追加
+        self.ai_name=""
         self._last_imgs:Dict[str,Dict[str,Any]]={}
-        self.log_q:queue.Queue[str]=queue.Queue()
+        self._img_lock=threading.Lock()
+        self._prep=ImagePrep(IMAGE_CACHE_DIR, max_side=IMAGE_MAX_SIDE,
+                             quality=IMAGE_QUALITY, max_entries=IMAGE_CACHE_MAX)
+        self._disp:Optional[Dispatcher]=None
+        self._poller:Optional[AdaptivePoller]=None
+        self._wake=threading.Event()             # stop_loop 时叫醒正在等待的轮询线程
+        self.record_file:Optional[str]=RECORD_FILE
+        self._rec:Optional[Recorder]=None
+        self._outbox=Outbox(self._deliver, rate=SEND_RATE, burst=SEND_BURST, chat_rate=SEND_CHAT_RATE,
+                            chat_burst=SEND_CHAT_BURST, max_chars=SEND_MERGE_CHARS)
+        self._chats:Dict[str,Any]={}            # 会话名 → wxauto 聊天对象，推送盯票用
+        self.watches=WatchScheduler(_watch_fetch, self._send_to, path=WATCH_FILE,
+                                    budget_per_min=WATCH_BUDGET, min_interval=WATCH_MIN_INTERVAL,
+                                    max_interval=WATCH_MAX_INTERVAL, per_chat=WATCH_PER_CHAT)
+        metrics.gauges(lambda: {f"outbox_{k}": v for k, v in self._outbox.stats().items()})
+        metrics.gauges(lambda: {f"watch_{k}": v for k, v in self.watches.stats().items()})
+        metrics.gauges(lambda: {f"dispatch_{k}": v for k, v in self._disp.stats().items()} if self._disp else {})
+        metrics.gauges(lambda: {f"ai_cache_{k}": v for k, v in ai.cache_stats().items()})
+        metrics.gauges(lambda: {f"poller_{k}": v for k, v in self._poller.stats().items()} if self._poller else {})
+
+    def _log(self, s:str):
+        self.sink.emit(s)
 
+    def add_rule(self, w:str, k:str, r:str):
+        self.mapping_list.append((w,k,r)); self.rules.add(w,k,r)
+
+    def load_settings(self, path:Path=SETTINGS_FILE)->bool:
+        """读入监听列表 / AI 名 / 关键词映射；文件不存在返回 False"""
+        if not path.exists(): return False
+        d=json.loads(path.read_text(encoding="utf-8"))
+        self.listen_list=[n.strip() for n in d.get("listen",[]) if n.strip()]
+        self.ai_name=d.get("ai_name","").strip()
+        for w,k,r in d.get("maps",[]):
+            self.add_rule(w,k,r)
+        return True
+
+    def connect(self):
+        """启动 wxauto 并监听 listen_list，返回 WeChat 实例；失败抛异常"""
+        from wxauto import WeChat
+        wx=WeChat(); wx.GetSessionList()
+        for n in self.listen_list:
+            wx.AddListenChat(who=n, savepic=True)
+            self._log(f"🔎 监听 {n}")
+        return wx
+
+    def _startup_done(self, mode:str):
+        dt=time.perf_counter()-_T0
+        metrics.observe("startup", dt)
+        self._log(f"🚀 启动耗时 {dt*1000:.0f} ms（{mode}）")
+
+    # ——— 启停 ——— #
+    def start_loop(self, wx):
+        """wx 已完成 AddListenChat；开始轮询"""
+        self.wx=wx; self.running=True
+        _chromes.warmup()
+        metrics.export_to(str(METRICS_FILE), METRICS_INTERVAL)
+        self._disp=Dispatcher(self._handle, workers=DISPATCH_WORKERS,
+                              per_key=DISPATCH_PER_CHAT, max_pending=DISPATCH_MAX_PENDING)
+        self._outbox.start()
+        self._poller=AdaptivePoller(fast=WAIT_INTERVAL, burst=POLL_BURST,
+                                    idle_max=POLL_IDLE_MAX, idle_after=POLL_IDLE_AFTER)
+        self._wake=threading.Event()
+        if self.record_file:
+            self._rec=Recorder(Path(self.record_file)); self._rec.start(ai_name=self.ai_name, listen=self.listen_list)
+            self._log(f"⏺️ 正在录制收发消息 → {self.record_file}")
+        threading.Thread(target=self._loop,daemon=True).start()
+        self.watches.start()
+
+    def stop_loop(self):
+        self.running=False; self._wake.set()
+        self.watches.stop()
+        skipped=self._disp.stop(timeout=DISPATCH_STOP_WAIT) if self._disp else 0; self._disp=None
+        unsent=self._outbox.stop(drain=SEND_DRAIN)
+        self._log("🛑 已停止"+(f"（丢弃未处理消息 {skipped} 条、未发出的回复 {unsent} 条）" if skipped or unsent else ""))
+        self._log(f"📊 余票缓存 {ticket_cache_stats()}")
+        self._log(f"📊 AI 会话 {ai.session_stats()}")
+        self._log(f"📊 AI 缓存 {ai.cache_stats()}")
+        if self._poller: self._log(f"📊 轮询 {self._poller.stats()}")
+        if self._rec: self._rec.close(); self._log(f"📊 录制 {self._rec.stats()}"); self._rec=None
+
+    def shutdown(self):
+        self.running=False; self._wake.set()
+        self.watches.stop()
+        if self._disp: self._disp.stop(timeout=0)
+        self._outbox.stop()
+        _chromes.close()
+        self._prep.shutdown()
+        if self._rec: self._rec.close(); self._rec=None
+        self.sink.close()
+
+    # ——— 主循环：只负责拉取消息并分发 ——— #
+    def _loop(self):
+        ai_tag=f"@{self.ai_name}"
+        disp,poller,wake,rec=self._disp,self._poller,self._wake,self._rec
+        next_sweep=time.monotonic()+IMAGE_TIMEOUT
+        while self.running and not wake.is_set():
+            c0=time.thread_time()
+            try:
+                if time.monotonic()>=next_sweep:
+                    self._sweep_imgs(); next_sweep=time.monotonic()+IMAGE_TIMEOUT
+                with timed("poll"):
+                    msgs=self.wx.GetListenMessage()
+                n=0
+                for chat,lst in msgs.items():
+                    self._chats[chat.who]=chat; n+=len(lst)
+                    for m in lst:
+                        if rec: rec.incoming(chat.who, m)
+                        if not disp.submit(chat.who, (chat,m,ai_tag)):
+                            inc("dispatch_rejected")
+                            if self.running:
+                                self._log(f"⚠️ [{chat.who}] 待处理消息过多，丢弃：{m.content.strip()[:30]}")
+                delay=poller.after_batch(n, time.thread_time()-c0)
+            except Exception as e:
+                delay=poller.after_error(e, time.thread_time()-c0)
+                self._log(f"⚠️ 异常（{delay:.1f}s 后重试）: {e}\n{traceback.format_exc()}")
+            wake.wait(delay)                     # 空闲时间隔逐步放宽，有消息立刻收紧
+
+    def _sweep_imgs(self):
+        """清掉超过 IMAGE_TIMEOUT 还没被提问用掉的图片"""
+        now=time.time()
+        with self._img_lock:
+            for who in [w for w,v in self._last_imgs.items() if now-v["time"]>IMAGE_TIMEOUT]:
+                self._last_imgs.pop(who).get("prep").cancel()
+
+    # ——— 发送：全部经 _outbox 排队、限速、合并，由它的线程调用 _deliver ——— #
+    def _send(self, chat, text:str, prio:int=PRIO_NORMAL):
+        if not self._outbox.put(chat, text, prio):
+            self._log(f"⚠️ [{chat.who}] {'已停止' if not self.running else '发送队列已满'}，丢弃：{text[:30]}")
+
+    def _deliver(self, chat, text:str):
+        with timed("send"):
+            chat.SendMsg(text)
+        rec=self._rec
+        if rec: rec.outgoing(chat.who, text)
+
+    def _send_to(self, who:str, text:str, prio:int=PRIO_LOW):
+        """按会话名发送（盯票推送）；重启后还没收到过该会话消息时走 wx.SendMsg"""
+        chat=self._chats.get(who)
+        if chat is None and self.wx is not None:
+            chat=_NamedChat(self.wx, who)
+        if chat is None:
+            self._log(f"⚠️ [{who}] 未连接微信，丢弃推送：{text[:30]}")
+            return
+        self._send(chat,text,prio)
+        self._log(f"🔔 [{who}] {text}")
+
+    # ——— 单条消息处理（worker 线程，同一会话内按序） ——— #
+    def _handle(self, item):
+        chat,m,ai_tag=item
+        try:
+            self._process(chat,m,ai_tag)
+        except Exception as e:
+            self._log(f"⚠️ 异常: {e}\n{traceback.format_exc()}")
+
+    @staticmethod
+    def _classify(m, txt:str, ai_tag:str):
+        """→ (类别, 参数)：img / train / tickets / transfer / page / watch / ai / keyword / other"""
+        if m.type in ("img","pic","image") or (
+            os.path.isfile(txt) and txt.lower().endswith((".jpg",".png",".jpeg",".bmp"))):
+            return "img", None
+        if m.type!="friend": return "other", None
+        if txt=="下一页": return "page", None
+        if ai_tag in txt:
+            cmd = txt.replace(ai_tag,"").strip().split()
+            if cmd==["下一页"]: return "page", None
+            # “车次 G123 上海 南京” / “车票 上海 南京”，@ 在前在后都行
+            if cmd and cmd[0]=="车次" and len(cmd)==4: return "train", cmd[1:]
+            if cmd and cmd[0]=="车票" and len(cmd)>=3: return "tickets", cmd[1:]
+            if cmd and cmd[0]=="换乘" and len(cmd)>=3: return "transfer", cmd[1:]
+            if cmd and cmd[0] in ("盯票","取消盯票","盯票列表"): return "watch", cmd
+            return "ai", txt.replace(ai_tag,"").strip()
+        return "keyword", None
+
+    def _process(self, chat, m, ai_tag:str):
+        who=chat.who
+        txt=m.content.strip()
+        with timed("classify"):
+            kind,arg=self._classify(m,txt,ai_tag)
+        inc(f"msg_{kind}")
+
+        # 图片：记录时间戳，后台预处理，用于多模态
+        if kind=="img":
+            with self._img_lock:
+                self._last_imgs[who]={"path":txt,"time":time.time(),"prep":self._prep.submit(txt)}
+            self._log(f"[{who}] 📷 {txt}"); return
+
+        self._log(f"[{who}]({m.type}) {txt}")
+
+        # —— 12306 查询 —— #
+        if kind=="train":
+            self._send(chat,query_tickets(*arg),PRIO_LOW); return
+        if kind=="tickets":
+            self._send(chat,query_all_tickets(*arg, who=who),PRIO_LOW); return
+        if kind=="transfer":
+            self._send(chat,query_transfer(*arg),PRIO_LOW); return
+        if kind=="page":
+            res=next_page(who)
+            if res: self._send(chat,res,PRIO_LOW); return
+            kind="keyword"                   # 没有可翻的页：当普通消息处理
+        if kind=="watch":
+            self._send(chat,self._watch_cmd(who,arg),PRIO_HIGH); return
+
+        # —— AI 回复 —— #
+        if kind=="ai":
+            q=arg
+            with self._img_lock:
+                img=self._last_imgs.pop(who,None)
+            if img and time.time()-img["time"]<=IMAGE_TIMEOUT:
+                path=self._prep.result(img["prep"], img["path"])
+                with timed("ai_multimodal"):
+                    res=ai.chat_multimodal(who,[{"image":path},{"text":q}])
+            elif AI_STREAM:
+                parts=[]; t0=time.perf_counter()
+                for part in ai.chat_stream(who,q):
+                    if not parts: metrics.observe("ai_first_part", time.perf_counter()-t0)
+                    self._send(chat,part); parts.append(part)
+                metrics.observe("ai_stream", time.perf_counter()-t0)
+                self._log(f"↪️ AI: {' ⏎ '.join(parts)}"); return
+            else:
+                with timed("ai_chat"):
+                    res=ai.chat(who,q)
+            self._send(chat,res); self._log(f"↪️ AI: {res}"); return
+
+        # —— 关键词映射 —— #
+        if kind=="keyword":
+            with timed("keyword"):
+                hit=self.rules.match(who,txt)
+            if hit:
+                self._send(chat,"[自动]"+hit[2],PRIO_HIGH)
+                self._log(f"↪️ 自动: {hit[2]}")
+
+    # ——— 盯票命令 ——— #
+    def _watch_cmd(self, who:str, cmd:List[str])->str:
+        """
+        盯票 上海 南京 [日期] [车次] [席别…]   日期缺省为明天
+        盯票列表 / 取消盯票 [编号]
+        """
+        op,args=cmd[0],cmd[1:]
+        if op=="盯票列表" or (op=="盯票" and not args):
+            ws=self.watches.list(who)
+            return "\n".join(["📋 当前盯票："]+[w.describe() for w in ws]) if ws else "📋 当前没有盯票"
+        if op=="取消盯票":
+            wid=args[0].lstrip("#") if args else None
+            if wid is not None and not wid.isdigit(): return "❌ 用法：取消盯票 [编号]"
+            gone=self.watches.remove(who, int(wid) if wid else None)
+            return "✅ 已取消 "+"、".join(f"#{w.id}" for w in gone) if gone else "🚫 没有对应的盯票"
+
+        if len(args)<2: return "❌ 用法：盯票 出发站 到达站 [日期] [车次] [席别]"
+        dep,arr,rest=args[0],args[1],args[2:]
+        dep_c,arr_c=get_station_code(dep),get_station_code(arr)
+        if not dep_c or not arr_c: return _station_miss(dep,arr)
+        date,train,seats=None,"",[]
+        for tok in rest:
+            d=parse_date(tok); s=seat_name(tok)
+            if d and not date: date=d
+            elif s: seats.append(s)
+            elif re.fullmatch(r"[A-Za-z]?\d{1,4}", tok) and not train: train=tok.upper()
+            else: return f"❌ 看不懂“{tok}”，用法：盯票 出发站 到达站 [日期] [车次] [席别]"
+        date=date or (datetime.now()+timedelta(days=1)).date().isoformat()
+        if date<datetime.now().date().isoformat(): return f"❌ {date} 已经过去了"
+        try:
+            w=self.watches.add(who, dep, arr, dep_c, arr_c, date, train, tuple(seats))
+        except ValueError as e:
+            return f"❌ {e}"
+        return f"✅ 已开始盯票 {w.describe()}，余票有变化会通知（取消：取消盯票 {w.id}）"
+
+# ——————————————— 主应用 ——————————————— #
+class WeChatBotApp(BotCore):
+    def __init__(self):
+        super().__init__(LogSink(LOG_FILE, max_bytes=LOG_FILE_MAX, backups=LOG_FILE_BACKUPS,
+                                 ui_lines=LOG_UI_BUFFER))
         self.root=tk.Tk()
         self.root.title(APP_NAME)
         self.root.geometry("480x680")        # 更舒适的默认窗口
@@ -182,6 +897,7 @@ class WeChatBotApp:
 
         # ——— 背景图 ——— #
         if BACKGROUND and Path(BACKGROUND).exists():
+            from PIL import Image, ImageTk
             self._orig_bg = Image.open(BACKGROUND)
             self._bg_img  = ImageTk.PhotoImage(self._orig_bg)
             self._bg_lbl  = tk.Label(self.root, image=self._bg_img, borderwidth=0)
@@ -221,17 +937,32 @@ class WeChatBotApp:
         self.btn_start.pack(side="left",expand=True,fill="x",padx=(0,4))
         self.btn_stop .pack(side="left",expand=True,fill="x",padx=(4,0))
 
-        ttk.Label(self.root,text="日志").pack(anchor="w", padx=8)
-        self.log = ScrolledText(self.root, state="disabled", height=12, font=("Consolas",9))
-        self.log.pack(fill="both", expand=True, padx=8, pady=(0,8))
+        nb = ttk.Notebook(self.root); nb.pack(fill="both", expand=True, padx=8, pady=(0,8))
+        self.log = ScrolledText(nb, state="disabled", height=12, font=("Consolas",9))
+        nb.add(self.log.frame, text="日志")
         self.root.after(100, self._flush_log)
 
+        # ——— 指标页：各阶段耗时分位数 + 计数 ——— #
+        mf = ttk.Frame(nb); nb.add(mf, text="指标")
+        cols = ("count","p50","p95","p99")
+        self.tv_stage = ttk.Treeview(mf, columns=cols, height=8)
+        self.tv_stage.heading("#0", text="阶段"); self.tv_stage.column("#0", width=110)
+        for c in cols:
+            self.tv_stage.heading(c, text=c if c=="count" else f"{c} ms")
+            self.tv_stage.column(c, width=70, anchor="e")
+        self.tv_stage.pack(fill="both", expand=True)
+        self.lbl_counters = ttk.Label(mf, text="", justify="left", wraplength=440, font=("Consolas",9))
+        self.lbl_counters.pack(fill="x", pady=(4,0))
+        metrics.sample_gauges(METRICS_UI_INTERVAL)
+        self.root.after(1000, self._refresh_metrics)
+
         self._load()   # 读入本地设置文件
 
     # ——— 背景自适应缩放 ——— #
     def _resize_bg(self, event):
         if not BACKGROUND: return
         if event.width < 50 or event.height < 50: return
+        from PIL import Image, ImageTk
         img = self._orig_bg.resize((event.width,event.height), Image.LANCZOS)
         self._bg_img = ImageTk.PhotoImage(img)
         self._bg_lbl.configure(image=self._bg_img)
@@ -245,20 +976,24 @@ class WeChatBotApp:
             "· 图片 + @AI + 提问，可触发多模态推理（需自备 ai.chat_multimodal）。\n"
             "· 12306 相关：\n"
             "    车次 G123 上海 南京   —— 查询当天 G123 时间\n"
-            "    车票 上海 南京        —— 查询明日所有车次余票")
+            "    车票 上海 南京        —— 查询明日所有车次余票\n"
+            "    车票 上海* 南京南 3天  —— 多站（上海* / 上海/上海虹桥）、多日（10-20~10-22）合并查询\n"
+            "    车票 上海 南京 G 8-12点 有票 按历时 —— 车型 / 出发时段 / 有票 / 排序，可任意组合\n"
+            "    下一页                —— 结果较多时分页发送，回复“下一页”继续\n"
+            "    换乘 上海 大理 10-20 G —— 没有直达车时搜一次中转的方案（按全程时长排序）\n"
+            "    盯票 上海 南京 10-20 G123 二等 —— 余票有变化时推送（日期/车次/席别可省）\n"
+            "    盯票列表 / 取消盯票 编号")
 
     # ——— 设置持久化 ——— #
     def _load(self):
-        if not SETTINGS_FILE.exists(): return
         try:
-            d=json.loads(SETTINGS_FILE.read_text(encoding="utf-8"))
-            self.t_names.insert("1.0", "\n".join(d.get("listen",[])))
-            self.ai.set(d.get("ai_name",""))
-            for w,k,r in d.get("maps",[]):
-                self.mapping_list.append((w,k,r))
-                self.lb_map.insert("end", f"{w or '*'} | {k} → {r}")
+            if not self.load_settings(): return
         except Exception as e:
-            self._log(f"⚠️ 读取设置失败：{e}")
+            self._log(f"⚠️ 读取设置失败：{e}"); return
+        self.t_names.insert("1.0", "\n".join(self.listen_list))
+        self.ai.set(self.ai_name)
+        for w,k,r in self.mapping_list:
+            self.lb_map.insert("end", f"{w or '*'} | {k} → {r}")
 
     def _save(self):
         BASE_DIR.mkdir(exist_ok=True)
@@ -269,31 +1004,43 @@ class WeChatBotApp:
         }, ensure_ascii=False, indent=2), encoding="utf-8")
 
     # ——— 日志输出 ——— #
-    def _log(self, s:str):
-        self.log_q.put(s)
-
     def _flush_log(self):
+        """每帧一次 insert；积压过多只显示最新的 LOG_FRAME_LINES 行，裁剪攒够 LOG_TRIM_CHUNK 行再做"""
         try:
-            while True:
-                line=self.log_q.get_nowait()
-                self.log.configure(state="normal")
-                self.log.insert("end", line+"\n")
-                if int(float(self.log.index("end"))) > LOG_TRIM_LINES:
-                    self.log.delete("1.0","3.0")
-                self.log.configure(state="disabled")
-                self.log.yview("end")
-        except queue.Empty:
-            pass
+            lines,skipped=self.sink.drain(LOG_FRAME_LINES)
+            if not lines: return
+            text="\n".join(l if len(l)<=LOG_LINE_CHARS else l[:LOG_LINE_CHARS]+" …" for l in lines)+"\n"
+            if skipped: text=f"…… 省略 {skipped} 行，完整内容见 {LOG_FILE.name}\n"+text
+            follow=self.log.yview()[1]>=0.999       # 用户往上翻看时不强行滚到底
+            self.log.configure(state="normal")
+            self.log.insert("end", text)
+            n=int(self.log.index("end-1c").split(".")[0])
+            if n > LOG_TRIM_LINES+LOG_TRIM_CHUNK:
+                self.log.delete("1.0", f"{n-LOG_TRIM_LINES+1}.0")
+            self.log.configure(state="disabled")
+            if follow: self.log.yview("end")
         finally:
             self.root.after(120, self._flush_log)
 
+    def _refresh_metrics(self):
+        try:
+            old=self.tv_stage.get_children()
+            if old: self.tv_stage.delete(*old)
+            for stage,row in metrics.snapshot().items():
+                self.tv_stage.insert("", "end", text=stage, values=(
+                    row["count"], *(f"{row[q]*1000:.1f}" for q in ("p50","p95","p99"))))
+            c=metrics.counters(cached=True)     # gauge 由 metrics-gauges 线程算，界面线程不调回调
+            self.lbl_counters.configure(text="  ".join(f"{k}={v}" for k,v in sorted(c.items())))
+        finally:
+            self.root.after(1000, self._refresh_metrics)
+
     # ——— 映射 & 启停 ——— #
     def add_map(self):
         w,k,r = (self.e_who.get().strip(), self.e_kw.get().strip(), self.e_rp.get().strip())
         if not k or not r or k.startswith("关键词"):
             messagebox.showwarning("提示","关键词 / 回复 不能为空")
             return
-        self.mapping_list.append((w,k,r))
+        self.add_rule(w,k,r)
         self.lb_map.insert("end", f"{w or '*'} | {k} → {r}")
         for e in (self.e_who,self.e_kw,self.e_rp): e.delete(0,"end")
         self._save()
@@ -304,88 +1051,83 @@ class WeChatBotApp:
             self._log("❌ 请填写监听好友")
             return
         try:
-            self.wx = WeChat(); self.wx.GetSessionList()
+            self.wx = self.connect()
         except Exception as e:
             messagebox.showerror("初始化失败", f"无法启动 wxauto：{e}")
             return
-        for n in self.listen_list:
-            self.wx.AddListenChat(who=n, savepic=True)
-            self._log(f"🔎 监听 {n}")
-        self.running=True
-        threading.Thread(target=self._loop,daemon=True).start()
+        self.ai_name=self.ai.get().strip()
+        self.start_loop(self.wx)
         self.btn_start["state"]="disabled"
         self.btn_stop ["state"]="normal"
         self._save()
 
     def stop(self):
-        self.running=False
+        self.stop_loop()
         self.btn_start["state"]="normal"
         self.btn_stop ["state"]="disabled"
-        self._log("🛑 已停止")
         self._save()
 
-    # ——— 主循环 ——— #
-    def _loop(self):
-        ai_tag=f"@{self.ai.get().strip()}"
-        while self.running:
-            try:
-                msgs=self.wx.GetListenMessage()
-                for chat,lst in msgs.items():
-                    who=chat.who
-                    for m in lst:
-                        txt=m.content.strip()
-
-                        # 图片：记录时间戳，用于多模态
-                        if m.type in ("img","pic","image") or (
-                            os.path.isfile(txt) and txt.lower().endswith((".jpg",".png",".jpeg",".bmp"))):
-                            self._last_imgs[who]={"path":txt,"time":time.time()}
-                            self._log(f"[{who}] 📷 {txt}"); continue
-
-                        self._log(f"[{who}]({m.type}) {txt}")
-
-                        # —— 12306 查询 —— #
-                        if m.type=="friend" and ai_tag in txt:
-                            cmd = txt.replace(ai_tag,"").strip().split()
-                            if txt.startswith("车次") and len(cmd)==3:
-                                ans=query_tickets(cmd[0],cmd[1],cmd[2]); chat.SendMsg(ans); continue
-                            if txt.startswith("车票") and len(cmd)==2:
-                                ans=query_all_tickets(cmd[0],cmd[1]); chat.SendMsg(ans); continue
-
-                        # —— AI 回复 —— #
-                        if m.type=="friend" and ai_tag in txt:
-                            q = txt.replace(ai_tag,"").strip()
-                            img=self._last_imgs.get(who)
-                            if img and time.time()-img["time"]<=IMAGE_TIMEOUT:
-                                res=ai.chat_multimodal(who,[{"image":img["path"]},{"text":q}])
-                                del self._last_imgs[who]
-                            else:
-                                res=ai.chat(who,q)
-                            chat.SendMsg(res); self._log(f"↪️ AI: {res}"); continue
-
-                        # —— 关键词映射 —— #
-                        for mw,mk,mr in self.mapping_list:
-                            if mk in txt and (not mw or mw==who) and m.type=="friend":
-                                chat.SendMsg("[自动]"+mr)
-                                self._log(f"↪️ 自动: {mr}")
-                                break
-                time.sleep(WAIT_INTERVAL)
-            except Exception as e:
-                self._log(f"⚠️ 异常: {e}\n{traceback.format_exc()}")
-                time.sleep(3)
-
     # ——— 关闭时清理 ——— #
     def on_close(self):
-        self.running=False
-        try: _Chrome.get().quit()
-        except Exception: pass
+        self.shutdown()
         self._save()
         self.root.destroy()
 
-    def run(self): self.root.mainloop()
+    def run(self):
+        self.root.after_idle(self._startup_done, "界面")
+        self.root.mainloop()
+
+# ——————————————— 无界面守护模式 ——————————————— #
+class HeadlessBot(BotCore):
+    """不建 Tk 窗口；设置取自 settings.json，日志经 LogSink 写 logging（默认落到滚动的 bot.log）"""
+    def __init__(self, settings:Path=SETTINGS_FILE, sink:Optional[LogSink]=None):
+        super().__init__(sink)
+        self.settings=settings
+        self._stop=threading.Event()
+
+    def run(self)->int:
+        if not self.load_settings(self.settings):
+            self._log(f"❌ 找不到设置文件 {self.settings}，请先用界面模式保存一次"); return 2
+        if not self.listen_list:
+            self._log("❌ settings.json 里没有监听好友"); return 2
+        try:
+            wx=self.connect()
+        except Exception as e:
+            self._log(f"❌ 无法启动 wxauto：{e}"); return 1
+        self.start_loop(wx)
+        self._startup_done("无界面")
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self._stop.set())
+        while not self._stop.wait(1): pass    # 带超时等待，Windows 下 Ctrl+C 才能及时生效
+        self.stop_loop()
+        self.shutdown()
+        return 0
 
 # ———————————————— 主入口 ———————————————— #
+def main():
+    ap=argparse.ArgumentParser(description=APP_NAME)
+    ap.add_argument("--headless", action="store_true", help="不启动界面，按 settings.json 运行")
+    ap.add_argument("--settings", type=Path, default=SETTINGS_FILE, help="--headless 时使用的设置文件")
+    ap.add_argument("--log-file", type=Path, default=LOG_FILE, help="--headless 时的日志文件，- 表示输出到终端")
+    ap.add_argument("--record", default=RECORD_FILE, metavar="FILE.jsonl.gz", help="录制收发消息，供 bench/e2e.py --replay 回放")
+    a=ap.parse_args()
+    if not a.headless:
+        bot=WeChatBotApp(); bot.record_file=a.record; bot.run(); return 0
+    if str(a.log_file)=="-":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s",
+                            datefmt="%Y-%m-%d %H:%M:%S", force=True)
+        sink=LogSink()
+    else:
+        logging.basicConfig(handlers=[logging.NullHandler()], force=True)   # 去掉 ai.py 装的终端输出
+        sink=LogSink(a.log_file, max_bytes=LOG_FILE_MAX, backups=LOG_FILE_BACKUPS, capture_root=True)
+    try:
+        bot=HeadlessBot(a.settings, sink); bot.record_file=a.record
+        return bot.run()
+    finally:
+        sink.close()     # 提前返回时也要把排队的日志写完
+
 if __name__ == "__main__":
     try:
-        WeChatBotApp().run()
+        sys.exit(main())
     except Exception:
         traceback.print_exc()
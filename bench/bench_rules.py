@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+关键词规则匹配微基准：原 mapping_list 顺序遍历 vs rules.KeywordRules
+————————————————————————————————————————————
+  python bench/bench_rules.py [--messages 2000] [--sizes 10,100,1000,10000]
+
+规则：2~4 字随机关键词，约 30% 绑定到 20 个好友之一；消息：20~60 字随机文本，
+约 10% 混入一条已有关键词。两种实现对每条消息的结果必须一致。
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rules import KeywordRules  # noqa: E402
+
+CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+FRIENDS = [f"好友{i}" for i in range(20)]
+
+
+def make_rules(n: int, rnd: random.Random):
+    return [(rnd.choice(FRIENDS) if rnd.random() < 0.3 else "",
+             "".join(rnd.choice(CHARS) for _ in range(rnd.randint(2, 4))),
+             f"回复{i}") for i in range(n)]
+
+
+def make_messages(n: int, rules, rnd: random.Random):
+    out = []
+    for _ in range(n):
+        txt = "".join(rnd.choice(CHARS) for _ in range(rnd.randint(20, 60)))
+        if rnd.random() < 0.1:
+            k = rnd.choice(rules)[1]
+            p = rnd.randint(0, len(txt))
+            txt = txt[:p] + k + txt[p:]
+        out.append((rnd.choice(FRIENDS), txt))
+    return out
+
+
+def linear(mapping_list, who, txt):
+    """与改动前 _loop 中的写法一致"""
+    for mw, mk, mr in mapping_list:
+        if mk in txt and (not mw or mw == who):
+            return mw, mk, mr
+    return None
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=2000)
+    ap.add_argument("--sizes", default="10,100,1000,10000")
+    a = ap.parse_args()
+
+    print(f"{'rules':>7} {'linear µs/msg':>14} {'AC µs/msg':>10} {'speedup':>8} {'build ms':>9}")
+    for n in map(int, a.sizes.split(",")):
+        rnd = random.Random(n)
+        rules = make_rules(n, rnd)
+        msgs = make_messages(a.messages, rules, rnd)
+
+        t0 = time.perf_counter()
+        expect = [linear(rules, w, t) for w, t in msgs]
+        t_lin = time.perf_counter() - t0
+
+        kr = KeywordRules(rules)
+        t0 = time.perf_counter()
+        for w in [""] + FRIENDS:
+            kr._automaton(w)
+        t_build = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        got = [kr.match(w, t) for w, t in msgs]
+        t_ac = time.perf_counter() - t0
+
+        assert got == expect, "结果不一致"
+        us = 1e6 / a.messages
+        print(f"{n:>7} {t_lin * us:>14.1f} {t_ac * us:>10.1f} {t_lin / t_ac:>7.1f}x {t_build * 1e3:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+首条消息耗时对比：ai.chat（整段返回）vs ai.chat_stream（按句流式）
+————————————————————————————————————————————
+  python bench/bench_stream.py [--first-token 0.3] [--per-char 0.02] [--runs 5]
+
+后端是 bench/fakes.py 的 FakeApplication，延迟参数可调。
+"""
+import argparse
+import statistics
+import time
+
+import fakes
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--first-token", default="0.3", help="延迟分布，见 fakes.Latency")
+    ap.add_argument("--per-char", default="0.02")
+    ap.add_argument("--runs", type=int, default=5)
+    a = ap.parse_args()
+    fakes.FakeApplication.first_token = fakes.Latency(a.first_token)
+    fakes.FakeApplication.per_char = fakes.Latency(a.per_char)
+    ai = fakes.install()
+    ai._bot.cache = ai.ReplyCache(ttl=0)      # 比的是接口本身的延迟，不走回答缓存
+
+    blocking, first, last, msgs = [], [], [], []
+    for i in range(a.runs):
+        t0 = time.perf_counter()
+        ai.chat(f"bench-b{i}", "71路哪能走")
+        blocking.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        parts = []
+        for part in ai.chat_stream(f"bench-s{i}", "71路哪能走"):
+            if not parts:
+                first.append(time.perf_counter() - t0)
+            parts.append(part)
+        last.append(time.perf_counter() - t0)
+        msgs.append(len(parts))
+
+    med = statistics.median
+    print(f"reply {len(fakes.FakeApplication.reply)} 字, first_token={a.first_token}s, per_char={a.per_char}s")
+    print(f"chat         首条消息 {med(blocking) * 1e3:7.0f} ms")
+    print(f"chat_stream  首条消息 {med(first) * 1e3:7.0f} ms   全部完成 {med(last) * 1e3:7.0f} ms"
+          f"   平均 {statistics.mean(msgs):.1f} 条")
+
+
+if __name__ == "__main__":
+    import logging
+    logging.disable(logging.INFO)
+    main()
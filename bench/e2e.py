@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端基准：合成流量 → BotCore._loop → 分发 → 处理 → FakeChat.SendMsg
+————————————————————————————————————————————
+  python bench/e2e.py                       # 跑全部场景，结果写入 bench/results/e2e-时间.json
+  python bench/e2e.py -s ai -s tickets      # 只跑指定场景
+  python bench/e2e.py --compare bench/results/e2e-旧.json   # 与上一次结果对比
+  python bench/e2e.py --set workers=8 --set rate=40         # 覆盖场景参数
+  python bench/e2e.py --replay cap.jsonl.gz --speed 10       # 回放 app.py --record 录下的真实流量（10 倍速）
+
+微信 / DashScope / Selenium 用 bench/fakes.py 的替身，12306 用 bench/stub_12306.py。
+每个场景在独立子进程里跑，缓存、会话、指标互不影响。
+统计口径：消息计划到达时刻 → 第一条回复经发送队列真正发出（reply）/ 处理结束（done）。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+AI_NAME = "bot"
+
+# 每个场景：消息速率 / 总数 / 会话数 / 消息类型占比 / 各替身延迟分布
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "keyword": dict(rate=80, total=1600, chats=20, rules=500, workers=4,
+                    mix={"keyword": 1.0}),
+    "ai": dict(rate=4, total=60, chats=8, workers=4,
+               mix={"ai": 1.0}, ai_first="lognormal:-1.2,0.4", ai_char="0.01"),
+    "tickets": dict(rate=10, total=120, chats=10, workers=4,
+                    mix={"tickets": 1.0}, stub_latency="uniform:0.05,0.15", chrome_overhead="0.3"),
+    "idle": dict(rate=0.5, total=20, chats=4, rules=50, workers=4,        # 稀疏消息：看轮询开销
+                 mix={"keyword": 1.0}),
+    "mixed": dict(rate=20, total=400, chats=16, rules=200, workers=4,
+                  mix={"keyword": 0.55, "ai": 0.2, "tickets": 0.15, "img": 0.1},
+                  ai_first="lognormal:-1.2,0.4", ai_char="0.01", mm_latency="uniform:0.8,1.5",
+                  stub_latency="uniform:0.05,0.15", chrome_overhead="0.3"),
+}
+DEFAULTS: Dict[str, Any] = dict(rules=0, ai_first="0.3", ai_char="0.01", mm_latency="1.0",
+                                stub_latency="0.05", chrome_overhead="0.3", poll_latency="0.005",
+                                send_latency="0.01", stream=True, timeout=300, seed=1,
+                                send_rate=None, chat_rate=None)     # None：用 app.py 里的发送限速
+# 回放场景：消息来自捕获文件，rate / total / chats / mix 不用
+REPLAY: Dict[str, Any] = dict(workers=4, speed=1.0, max_gap=10.0, settings="", rules=0, chats=0, mix={})
+ROUTES = [("上海虹桥", "南京南"), ("上海", "南京")]
+
+
+def _pct(xs: List[float]) -> Dict[str, float]:
+    if not xs:
+        return {"n": 0}
+    xs = sorted(xs)
+    pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))]
+    return {"n": len(xs), "mean": round(statistics.mean(xs), 4), "p50": round(pick(0.5), 4),
+            "p95": round(pick(0.95), 4), "p99": round(pick(0.99), 4), "max": round(xs[-1], 4)}
+
+
+# ————————————————— 子进程：跑一个场景 ————————————————— #
+def run_scenario(name: str, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    import logging
+    logging.disable(logging.CRITICAL)
+    sys.path.insert(0, str(BENCH_DIR))
+    import fakes
+    from fakes import Latency
+    from stub_12306 import Stub12306
+
+    ai, app = fakes.install(with_app=True)
+    from cache import SqliteCache
+    from metrics import metrics
+
+    fakes.FakeApplication.first_token = Latency(cfg["ai_first"], cfg["seed"])
+    fakes.FakeApplication.per_char = Latency(cfg["ai_char"], cfg["seed"] + 1)
+    fakes.FakeMultiModal.latency = Latency(cfg["mm_latency"], cfg["seed"] + 2)
+    fakes.FakeChrome.overhead = Latency(cfg["chrome_overhead"], cfg["seed"] + 3)
+    stub = Stub12306(latency=Latency(cfg["stub_latency"], cfg["seed"] + 4).sample).start()
+    app.TICKET_BASE_URL = stub.base_url
+    tmp = Path(tempfile.mkdtemp(prefix="wxbot-bench-"))
+    app.METRICS_FILE = tmp / "metrics.prom"
+    app.WATCH_FILE = tmp / "watches.json"
+    if app._shared:                       # 每个场景从空的共享缓存开始，结果才可比
+        app._shared = SqliteCache(tmp / "cache.sqlite3", ttl=app.TICKET_CACHE_TTL, max_bytes=app.SHARED_CACHE_MAX,
+                                  namespace="leftTicket")
+    app.DISPATCH_WORKERS = cfg["workers"]
+    app.AI_STREAM = cfg["stream"]
+    if cfg["send_rate"]: app.SEND_RATE = app.SEND_BURST = cfg["send_rate"]
+    if cfg["chat_rate"]: app.SEND_CHAT_RATE = app.SEND_CHAT_BURST = cfg["chat_rate"]
+
+    img = tmp / "photo.jpg"
+    try:
+        from PIL import Image
+        Image.new("RGB", (2400, 1800), (90, 140, 200)).save(img, quality=95)
+    except ImportError:
+        img.write_bytes(b"\xff\xd8\xff\xd9")
+
+    rnd = random.Random(cfg["seed"])
+    kinds, weights = zip(*cfg["mix"].items()) if cfg["mix"] else ((), ())
+
+    def make_msg(chat: int, seq: int) -> "fakes.FakeMsg":
+        kind = rnd.choices(kinds, weights)[0]
+        if kind == "keyword":
+            m = fakes.FakeMsg("friend", f"请问现在几点了 #{seq}")
+        elif kind == "ai":
+            m = fakes.FakeMsg("friend", f"@{AI_NAME} 71路哪能走 #{seq}")
+        elif kind == "tickets":
+            dep, arr = rnd.choice(ROUTES)
+            m = fakes.FakeMsg("friend", f"@{AI_NAME} 车票 {dep} {arr}")
+        else:
+            m = fakes.FakeMsg("image", str(img))
+        m.kind = kind
+        return m
+
+    class BenchBot(app.BotCore):
+        """记录每条消息的处理完成时刻，以及第一条回复真正发出（出队并 SendMsg）的时刻"""
+
+        def __init__(self) -> None:
+            super().__init__()
+            self._cur = threading.local()
+            self._rec_lock = threading.Lock()
+            self.reply: Dict[str, List[float]] = {}
+            self.done: Dict[str, List[float]] = {}
+            self.processed = 0
+
+        def _process(self, chat, m, ai_tag):
+            self._cur.msg = m
+            try:
+                super()._process(chat, m, ai_tag)
+            finally:
+                now = time.perf_counter()
+                with self._rec_lock:
+                    self.processed += 1
+                    self.done.setdefault(m.kind, []).append(now - m.t_arrive)
+
+        def _send(self, chat, text, prio=app.PRIO_NORMAL):
+            m = getattr(self._cur, "msg", None)
+            self._outbox.put(chat, text, prio, on_sent=lambda t: m and self._on_sent(m, t))
+
+        def _on_sent(self, m, t):
+            with self._rec_lock:
+                if not getattr(m, "replied", False):
+                    m.replied = True
+                    self.reply.setdefault(m.kind, []).append(t - m.t_arrive)
+
+    bot = BenchBot()
+    bot.ai_name = AI_NAME
+    for i in range(cfg["rules"]):
+        bot.add_rule("", f"无关词{i}", f"回复{i}")
+    bot.add_rule("", "几点", "自己看手表")
+
+    capture = None
+    if cfg.get("replay"):
+        from capture import read
+        events = list(read(Path(cfg["replay"])))
+        incoming = [e for e in events if e["ev"] == "in"]
+        if cfg["settings"]:
+            bot.load_settings(Path(cfg["settings"]))         # 线上的关键词映射
+        bot.ai_name = next((e["ai_name"] for e in events if e["ev"] == "start" and e.get("ai_name")), bot.ai_name)
+        tag = f"@{bot.ai_name}"
+
+        def replay_msg(e: Dict[str, Any]) -> "fakes.FakeMsg":
+            content = e.get("content") or ""
+            if e.get("type") == "image" and not Path(content).exists():
+                content = str(img)                        # 录制机器上的图片本地没有，换成合成图
+            m = fakes.FakeMsg(e.get("type", "friend"), content, e.get("sender", ""))
+            m.kind = bot._classify(m, content.strip(), tag)[0]
+            return m
+
+        capture = {"file": cfg["replay"], "messages": len(incoming),
+                   "recorded_replies": sum(e["ev"] == "out" for e in events),
+                   "span_s": round(incoming[-1]["t"] - incoming[0]["t"], 1) if incoming else 0.0}
+        wx = fakes.ReplayWeChat(incoming, replay_msg, speed=cfg["speed"], max_gap=cfg["max_gap"],
+                                poll_latency=Latency(cfg["poll_latency"]), send_latency=Latency(cfg["send_latency"]))
+    else:
+        wx = fakes.FakeWeChat([f"群{i}" for i in range(cfg["chats"])], cfg["rate"], cfg["total"], make_msg,
+                              poll_latency=Latency(cfg["poll_latency"]), send_latency=Latency(cfg["send_latency"]),
+                              seed=cfg["seed"])
+    t0 = time.perf_counter()
+    bot.start_loop(wx)
+    deadline = t0 + cfg["timeout"]
+    rejected = lambda: metrics.counters().get("dispatch_rejected", 0)
+    while time.perf_counter() < deadline and not (wx.done and bot.processed + rejected() >= wx.emitted
+                                                  and not bot._outbox.stats()["pending"]):
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    bot.stop_loop()
+    bot.shutdown()
+
+    all_done = [x for xs in bot.done.values() for x in xs]
+    return {
+        "scenario": name,
+        "config": cfg,
+        "messages": wx.emitted,
+        "processed": bot.processed,
+        "rejected": rejected(),
+        "replies": sum(len(c.sent) for c in wx.chats),
+        "outbox": bot._outbox.stats(),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(bot.processed / elapsed, 2) if elapsed else 0.0,
+        "polls": wx.polls,
+        "poller": bot._poller.stats() if getattr(bot, "_poller", None) else {},     # 旧版本没有
+        "reply_latency": {k: _pct(v) for k, v in sorted(bot.reply.items())},
+        "done_latency": {**{k: _pct(v) for k, v in sorted(bot.done.items())}, "all": _pct(all_done)},
+        "stages": {k: {q: round(v, 6) for q, v in row.items()} for k, row in metrics.snapshot().items()},
+        "counters": metrics.counters(),
+        "stub": {"queries": stub.queries, "blocked": stub.blocked},
+        "ai_calls": fakes.FakeApplication.calls,
+        "capture": capture,
+    }
+
+
+# ————————————————— 父进程：调度 / 汇总 / 对比 ————————————————— #
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _parse_set(items: List[str]) -> Dict[str, Any]:
+    out = {}
+    for it in items:
+        k, _, v = it.partition("=")
+        try:
+            out[k] = json.loads(v)
+        except ValueError:
+            out[k] = v
+    return out
+
+
+def _summary(res: Dict[str, Any]) -> str:
+    lat = res["reply_latency"]
+    parts = [f"{k} p50={v['p50'] * 1e3:.0f}ms p95={v['p95'] * 1e3:.0f}ms" for k, v in lat.items() if v["n"]]
+    drop = f" (丢弃 {res['rejected']})" if res.get("rejected") else ""
+    cap = res.get("capture")
+    if cap:
+        parts.append(f"回复 {res['replies']} 条（录制时 {cap['recorded_replies']} 条）")
+    return (f"{res['scenario']:<9} {res['processed']:>5} msgs{drop}  {res['throughput_msg_s']:>7.1f} msg/s  "
+            + "  ".join(parts))
+
+
+def _compare(cur: Dict[str, Any], base: Dict[str, Any]) -> None:
+    print(f"\n对比基线 {base.get('git', '?')} @ {base.get('time', '?')}")
+    for name, r in cur["scenarios"].items():
+        b = base.get("scenarios", {}).get(name)
+        if not b:
+            continue
+        d = lambda new, old: f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {name:<9} throughput {b['throughput_msg_s']:.1f} → {r['throughput_msg_s']:.1f} "
+              f"({d(r['throughput_msg_s'], b['throughput_msg_s'])})")
+        for kind, v in r["reply_latency"].items():
+            o = b["reply_latency"].get(kind)
+            if o and o.get("n") and v.get("n"):
+                print(f"    {kind:<8} p50 {o['p50'] * 1e3:.0f} → {v['p50'] * 1e3:.0f} ms ({d(v['p50'], o['p50'])})"
+                      f"   p95 {o['p95'] * 1e3:.0f} → {v['p95'] * 1e3:.0f} ms ({d(v['p95'], o['p95'])})")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS))
+    ap.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖场景参数")
+    ap.add_argument("--compare", type=Path, help="基线结果 JSON")
+    ap.add_argument("--replay", type=Path, help="回放捕获文件（app.py --record 录制），作为 replay 场景运行")
+    ap.add_argument("--speed", type=float, default=REPLAY["speed"], help="回放倍速")
+    ap.add_argument("--settings", type=Path, help="回放时加载的 settings.json（关键词映射 / AI 名）")
+    ap.add_argument("-o", "--output", type=Path, help="结果文件（默认 bench/results/e2e-时间.json）")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    a = ap.parse_args()
+
+    if a.child:
+        cfg = json.loads(a.child)
+        print(json.dumps(run_scenario(cfg.pop("_name"), cfg), ensure_ascii=False))
+        return
+
+    overrides = _parse_set(a.set)
+    result = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "git": _git_rev(),
+              "python": platform.python_version(), "scenarios": {}}
+    runs = [(name, {**DEFAULTS, **SCENARIOS[name], **overrides}) for name in a.scenario or ([] if a.replay else SCENARIOS)]
+    if a.replay:
+        runs.append(("replay", {**DEFAULTS, **REPLAY, "speed": a.speed, "settings": str(a.settings or ""),
+                                **overrides, "replay": str(a.replay.resolve())}))
+    for name, cfg in runs:
+        cfg["_name"] = name
+        proc = subprocess.run([sys.executable, __file__, "--child", json.dumps(cfg, ensure_ascii=False)],
+                              capture_output=True, text=True, encoding="utf-8",
+                              env={**os.environ, "PYTHONIOENCODING": "utf-8"})
+        if proc.returncode != 0:
+            print(f"{name}: 失败\n{proc.stderr}", file=sys.stderr)
+            continue
+        res = json.loads(proc.stdout.strip().splitlines()[-1])
+        result["scenarios"][name] = res
+        print(_summary(res))
+
+    out = a.output or RESULTS_DIR / f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已写入 {out}")
+    if a.compare:
+        _compare(result, json.loads(a.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+本地替身：不需要微信客户端、DashScope key 和 12306 也能驱动 app.py / ai.py
+————————————————————————————————————————————
+• Latency            延迟分布："0.3" / "const:0.3" / "uniform:0.2,0.8" / "exp:0.5" / "lognormal:-1.2,0.5"
+• FakeApplication    与 dashscope.Application.call 返回结构一致，支持 stream + incremental_output
+• FakeMultiModal     与 dashscope.MultiModalConversation.call 返回结构一致
+• FakeWeChat         按给定消息速率从 GetListenMessage 吐出消息，FakeChat 记录 SendMsg
+• ReplayWeChat       按 capture.py 录下的时间间隔（可加速）吐出真实消息
+• FakeChrome         代替 Selenium：HTTP 访问本地 12306 桩服务，可附加“浏览器开销”
+• install()          把以上替身装进 ai / app，返回 (ai, app)
+"""
+import json
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+REPLY = ("侬好呀！今朝天气老好额，阿拉一道去坐71路中运量好伐？"
+         "从延安东路外滩一直开到申昆路枢纽站，一路浪向风景交关灵。"
+         "车子是新额电车，坐起来老适意额。侬要是欢喜看车，可以坐到终点站再兜回来。")
+
+
+class Latency:
+    """可采样的延迟分布（秒）"""
+
+    def __init__(self, spec: "str | float" = 0.0, seed: Optional[int] = None) -> None:
+        self.spec = str(spec)
+        kind, _, args = self.spec.partition(":") if ":" in self.spec else ("const", "", self.spec)
+        vals = [float(x) for x in args.split(",") if x]
+        rnd = random.Random(seed)
+        samplers: Dict[str, Callable[[], float]] = {
+            "const": lambda: vals[0],
+            "uniform": lambda: rnd.uniform(vals[0], vals[1]),
+            "exp": lambda: rnd.expovariate(1 / vals[0]) if vals[0] else 0.0,
+            "lognormal": lambda: rnd.lognormvariate(vals[0], vals[1]),
+        }
+        if kind not in samplers:
+            raise ValueError(f"未知延迟分布：{spec}")
+        self._sample = samplers[kind]
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            return max(0.0, self._sample())
+
+    def __repr__(self) -> str:
+        return f"Latency({self.spec!r})"
+
+
+# ————————————————— DashScope ————————————————— #
+class _Output:
+    def __init__(self, text: str, session_id: str) -> None:
+        self.text = text
+        self.session_id = session_id
+
+
+class _Resp:
+    def __init__(self, output, status: int = HTTPStatus.OK) -> None:
+        self.status_code = status
+        self.request_id = uuid.uuid4().hex
+        self.message = ""
+        self.output = output
+
+
+class FakeApplication:
+    """
+    first_token：首个 token 前的延迟，per_char：之后每个字的生成耗时。
+    非流式调用等全部生成完才返回，和真实接口一样。
+    """
+    first_token: Latency = Latency(0.3)
+    per_char: Latency = Latency(0.02)
+    chunk_chars: int = 4
+    reply: str = REPLY
+    calls: int = 0
+
+    @classmethod
+    def call(cls, api_key: str = "", app_id: str = "", prompt: str = "",
+             session_id: Optional[str] = None, stream: bool = False,
+             incremental_output: bool = False, **_):
+        cls.calls += 1
+        sid = session_id or uuid.uuid4().hex
+        if not stream:
+            time.sleep(cls.first_token.sample() + cls.per_char.sample() * len(cls.reply))
+            return _Resp(_Output(cls.reply, sid))
+        return cls._stream(sid, incremental_output)
+
+    @classmethod
+    def _stream(cls, sid: str, incremental: bool) -> Iterator[_Resp]:
+        time.sleep(cls.first_token.sample())
+        per_char, n = cls.per_char.sample(), cls.chunk_chars
+        for i in range(0, len(cls.reply), n):
+            time.sleep(per_char * n)
+            text = cls.reply[i:i + n] if incremental else cls.reply[:i + n]
+            yield _Resp(_Output(text, sid))
+
+
+class FakeMultiModal:
+    latency: Latency = Latency(1.0)
+    reply: str = "图里是一部71路电车，停在延安东路外滩站。"
+    calls: int = 0
+
+    @classmethod
+    def call(cls, api_key: str = "", model: str = "", messages=None, **_):
+        cls.calls += 1
+        time.sleep(cls.latency.sample())
+        msg = types.SimpleNamespace(content=[{"text": cls.reply}])
+        out = types.SimpleNamespace(choices=[types.SimpleNamespace(message=msg)])
+        return _Resp(out)
+
+
+# ————————————————— wxauto ————————————————— #
+class FakeMsg:
+    def __init__(self, type: str, content: str, sender: str = "") -> None:
+        self.type = type
+        self.content = content
+        self.sender = sender
+        self.t_arrive = time.perf_counter()     # 基准统计用：消息“到达”时刻
+
+
+class FakeChat:
+    def __init__(self, who: str, send_latency: Latency) -> None:
+        self.who = who
+        self.send_latency = send_latency
+        self.sent: List[str] = []
+        self._lock = threading.Lock()
+
+    def SendMsg(self, msg: str, at=None) -> None:
+        time.sleep(self.send_latency.sample())
+        with self._lock:
+            self.sent.append(msg)
+
+    def __repr__(self) -> str:
+        return f"<FakeChat {self.who}>"
+
+
+class FakeWeChat:
+    """
+    make_msg(chat_index, seq) → FakeMsg 决定消息内容；rate 为全局消息速率（条/秒，泊松到达）。
+    发完 total 条后 GetListenMessage 只返回空。
+    """
+
+    def __init__(self, chats: List[str], rate: float, total: int,
+                 make_msg: Callable[[int, int], FakeMsg],
+                 poll_latency: Latency = Latency(0.005),
+                 send_latency: Latency = Latency(0.01),
+                 seed: int = 0) -> None:
+        self.chats = [FakeChat(w, send_latency) for w in chats]
+        self.rate = rate
+        self.total = total
+        self.make_msg = make_msg
+        self.poll_latency = poll_latency
+        self.emitted = 0
+        self.polls = 0
+        self._rnd = random.Random(seed)
+        self._next = None
+
+    def GetSessionList(self):
+        return {c.who: 0 for c in self.chats}
+
+    def AddListenChat(self, who: str, savepic: bool = False) -> None:
+        pass
+
+    def GetListenMessage(self):
+        time.sleep(self.poll_latency.sample())
+        self.polls += 1
+        now = time.perf_counter()
+        if self._next is None:
+            self._next = now
+        out: Dict[FakeChat, List[FakeMsg]] = {}
+        while self.emitted < self.total and self._next <= now:
+            i = self._rnd.randrange(len(self.chats))
+            m = self.make_msg(i, self.emitted)
+            m.t_arrive = self._next
+            out.setdefault(self.chats[i], []).append(m)
+            self.emitted += 1
+            self._next += self._rnd.expovariate(self.rate)
+        return out
+
+    @property
+    def done(self) -> bool:
+        return self.emitted >= self.total
+
+
+class ReplayWeChat:
+    """
+    events：capture.read() 里的 "in" 事件；make_msg(event) → FakeMsg。
+    相邻消息的间隔除以 speed，超过 max_gap 秒的空档（夜里没人说话）压缩成 max_gap。
+    接口、统计字段与 FakeWeChat 一致。
+    """
+
+    def __init__(self, events: List[Dict[str, Any]], make_msg: Callable[[Dict[str, Any]], FakeMsg],
+                 speed: float = 1.0, max_gap: float = 10.0,
+                 poll_latency: Latency = Latency(0.005),
+                 send_latency: Latency = Latency(0.01)) -> None:
+        whos = list(dict.fromkeys(e["who"] for e in events))
+        self.chats = [FakeChat(w, send_latency) for w in whos]
+        self._chat = {c.who: c for c in self.chats}
+        self.make_msg = make_msg
+        self.poll_latency = poll_latency
+        self._offsets: List[float] = []
+        off, prev = 0.0, None
+        for e in events:
+            if prev is not None:
+                off += min(max(0.0, e["t"] - prev), max_gap) / speed
+            prev = e["t"]
+            self._offsets.append(off)
+        self._events = events
+        self.total = len(events)
+        self.emitted = 0
+        self.polls = 0
+        self._start: Optional[float] = None
+
+    def GetSessionList(self):
+        return {c.who: 0 for c in self.chats}
+
+    def AddListenChat(self, who: str, savepic: bool = False) -> None:
+        pass
+
+    def GetListenMessage(self):
+        time.sleep(self.poll_latency.sample())
+        self.polls += 1
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now
+        out: Dict[FakeChat, List[FakeMsg]] = {}
+        while self.emitted < self.total and self._start + self._offsets[self.emitted] <= now:
+            e = self._events[self.emitted]
+            m = self.make_msg(e)
+            m.t_arrive = self._start + self._offsets[self.emitted]
+            out.setdefault(self._chat[e["who"]], []).append(m)
+            self.emitted += 1
+        return out
+
+    @property
+    def done(self) -> bool:
+        return self.emitted >= self.total
+
+
+# ————————————————— Selenium ————————————————— #
+class FakeChrome:
+    """与 app._Chrome 接口一致；数据来自 app.TICKET_BASE_URL 指向的桩服务"""
+    overhead: Latency = Latency(0.3)     # 模拟整页导航的额外开销
+    startup: Latency = Latency(0.0)      # 模拟冷启动
+
+    def __init__(self) -> None:
+        import urllib3
+        import app
+        time.sleep(self.startup.sample())
+        self._base = app.TICKET_BASE_URL
+        self._http = urllib3.PoolManager()
+        r = self._http.request("GET", f"{self._base}/otn/leftTicket/init")
+        self._cookie = (r.headers.get("Set-Cookie") or "").split(";")[0]
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+    def healthy(self) -> bool:
+        return True
+
+    def fetch_json(self, dep: str, arr: str, date: str) -> dict:
+        self.uses += 1
+        time.sleep(self.overhead.sample())
+        r = self._http.request("GET", f"{self._base}/otn/leftTicket/query", headers={"Cookie": self._cookie},
+                               fields={"leftTicketDTO.train_date": date, "leftTicketDTO.from_station": dep,
+                                       "leftTicketDTO.to_station": arr, "purpose_codes": "ADULT"})
+        return json.loads(r.data.decode("utf-8"))
+
+    def cookies(self) -> Dict[str, str]:
+        k, _, v = self._cookie.partition("=")
+        return {k: v} if k else {}
+
+    def user_agent(self) -> str:
+        return "FakeChrome/1.0"
+
+    def quit(self) -> None:
+        pass
+
+
+def install(with_app: bool = False):
+    """
+    让 ai（以及 with_app=True 时的 app）使用本地替身。
+    返回 ai 模块，或 (ai, app)。BotCore.connect() 不经过替身，直接把 FakeWeChat 传给 start_loop。
+    """
+    import ai
+    ai.Application = FakeApplication
+    ai.MultiModalConversation = FakeMultiModal
+    if not with_app:
+        return ai
+
+    import app
+    app._Chrome = FakeChrome
+    return ai, app
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地 12306 桩服务：回放 bench/data/leftTicket/ 下录制的余票 JSON
+————————————————————————————————————————————
+  python bench/stub_12306.py --port 8306 [--block-every 5] [--latency 0.05]
+  TICKET_BASE_URL=http://127.0.0.1:8306 python app.py
+
+• /otn/leftTicket/init   下发 cookie
+• /otn/leftTicket/query  按 {from}_{to}.json 查找录制文件，找不到返回空结果
+• --block-every N        每 N 次查询（或缺 cookie 时）返回反爬页面，用来测回退逻辑
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+from urllib.parse import parse_qs, urlparse
+
+DATA_DIR = Path(__file__).parent / "data" / "leftTicket"
+BLOCK_PAGE = "<html><body>网络可能存在问题，请您重试一下！</body></html>"
+
+
+class Stub12306(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr=("127.0.0.1", 0), data_dir: Path = DATA_DIR,
+                 block_every: int = 0, latency: Union[float, Callable[[], float]] = 0.0) -> None:
+        super().__init__(addr, _Handler)
+        self.data_dir = data_dir
+        self.block_every = block_every
+        self.latency = latency
+        self.queries = 0
+        self.blocked = 0
+        self._lock = threading.Lock()
+        self._recorded: Dict[str, bytes] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def recorded(self, dep: str, arr: str) -> bytes:
+        key = f"{dep}_{arr}"
+        if key not in self._recorded:
+            f = self.data_dir / f"{key}.json"
+            self._recorded[key] = f.read_bytes() if f.exists() else json.dumps(
+                {"httpstatus": 200, "data": {"result": [], "flag": "1", "map": {}},
+                 "messages": "", "status": True}).encode()
+        return self._recorded[key]
+
+    def start(self) -> "Stub12306":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: Stub12306
+
+    def log_message(self, *_):
+        pass
+
+    def _reply(self, code: int, body: bytes, ctype: str, cookie: Optional[str] = None) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        if cookie:
+            self.send_header("Set-Cookie", cookie)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/otn/leftTicket/init":
+            self._reply(200, b"<html><body>init</body></html>", "text/html; charset=utf-8",
+                        cookie=f"JSESSIONID=stub{int(time.time())}; Path=/")
+            return
+        if url.path != "/otn/leftTicket/query":
+            self._reply(404, b"", "text/plain")
+            return
+
+        srv = self.server
+        delay = srv.latency() if callable(srv.latency) else srv.latency
+        if delay:
+            time.sleep(delay)
+        with srv._lock:
+            srv.queries += 1
+            block = "JSESSIONID" not in (self.headers.get("Cookie") or "") or (
+                srv.block_every and srv.queries % srv.block_every == 0)
+            srv.blocked += bool(block)
+        if block:
+            self._reply(200, BLOCK_PAGE.encode(), "text/html; charset=utf-8")
+            return
+        q = parse_qs(url.query)
+        body = srv.recorded(q.get("leftTicketDTO.from_station", [""])[0],
+                            q.get("leftTicketDTO.to_station", [""])[0])
+        self._reply(200, body, "application/json;charset=UTF-8")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8306)
+    ap.add_argument("--block-every", type=int, default=0)
+    ap.add_argument("--latency", type=float, default=0.0, help="每次查询额外延迟（秒）")
+    a = ap.parse_args()
+    srv = Stub12306(("127.0.0.1", a.port), block_every=a.block_every, latency=a.latency)
+    print(f"12306 stub on {srv.base_url}")
+    srv.serve_forever()
@@ -0,0 +1,317 @@
+"""
+带 TTL 的 LRU 缓存 + 请求合并（single-flight）
+————————————————————————————————————————————
+• 过期时间按写入时刻计算，超过 maxsize 时淘汰最久未用的条目
+• get_or_load：同一个 key 同时只会有一个 loader 在跑，其余线程等待并共享结果
+  （loader 抛异常时不缓存，等待者收到同一个异常）
+• stats() 给出 hits / misses / coalesced 计数，用来调 TTL
+• SqliteCache：同样的接口落在 SQLite 文件里，同一台机器上的多个进程共用、重启后还在
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Flight:
+    """一次正在进行的加载"""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    def __init__(self, ttl: float = 60.0, maxsize: int = 256) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize 必须 ≥ 1")
+        self.ttl: float = ttl
+        self.maxsize: int = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()  # key → (过期时刻, 值)
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.coalesced: int = 0
+        self.evictions: int = 0
+
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """调用方需持有锁"""
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        if item[0] <= time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, item[1]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        """调用方需持有锁"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            hit, value = self._lookup(key)
+            if hit:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """命中直接返回；未命中时只让一个线程执行 loader，其余线程等它的结果"""
+        with self._lock:
+            hit, value = self._lookup(key)
+            if hit:
+                self.hits += 1
+                return value
+            flight = self._flights.get(key)
+            if flight is None:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            with self._lock:
+                self._store(key, flight.value)
+            return flight.value
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """删除一个 key；不传 key 时清空"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            }
+
+
+_MISS = object()
+
+
+class SqliteCache:
+    """
+    进程间共享的 TTL 缓存：值 JSON + zlib 压缩后存进 SQLite（WAL 模式，读写互不阻塞）。
+    • 过期按墙上时钟（time.time()）算，各进程一致；写入时顺带清理过期条目，总大小超过 max_bytes 时先淘汰最早过期的
+    • get_or_load 跨进程合并请求：先在 flights 表里占位，别的进程看到占位就轮询等结果，最多等 flight_wait 秒
+    • 每个线程一个连接，首次使用时才打开文件；数据库出错只记日志、当作未命中，不影响查询本身
+    • namespace 区分不同用途的数据，多个实例可以共用一个文件
+    """
+
+    def __init__(self, path: Path, ttl: float = 60.0, max_bytes: int = 64 << 20,
+                 namespace: str = "default", flight_wait: float = 15.0) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        self.flight_wait = flight_wait
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = self.misses = self.coalesced = self.errors = self.evictions = 0
+
+    # ——— 连接 ——— #
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS cache (ns TEXT, key TEXT, value BLOB, expires REAL, "
+                       "size INTEGER, PRIMARY KEY (ns, key))")
+            db.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+            db.execute("CREATE TABLE IF NOT EXISTS flights (ns TEXT, key TEXT, until REAL, PRIMARY KEY (ns, key))")
+            self._local.db = db
+        return db
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    # ——— 读写 ——— #
+    def _get(self, key: str) -> Any:
+        try:
+            row = self._db().execute("SELECT value FROM cache WHERE ns=? AND key=? AND expires>?",
+                                     (self.namespace, key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning("共享缓存读取失败：%s", e)
+            return _MISS
+        if row is None:
+            return _MISS
+        try:
+            return json.loads(zlib.decompress(row[0]))
+        except (zlib.error, ValueError, TypeError) as e:     # 行损坏 / 被截断：删掉当作没命中
+            self._count("errors")
+            logging.warning("共享缓存条目损坏，已删除 %s：%s", key, e)
+            try:
+                self._db().execute("DELETE FROM cache WHERE ns=? AND key=?", (self.namespace, key))
+            except sqlite3.Error:
+                pass
+            return _MISS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._get(key)
+        self._count("misses" if value is _MISS else "hits")
+        return default if value is _MISS else value
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 1)
+        try:
+            self._db().execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                               (self.namespace, key, blob, time.time() + (self.ttl if ttl is None else ttl),
+                                len(blob)))
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning("共享缓存写入失败：%s", e)
+            return
+        with self._lock:
+            self._puts += 1
+            sweep = self._puts % 32 == 1
+        if sweep:
+            self._evict()
+
+    def _evict(self) -> None:
+        """删掉所有过期条目；总大小仍超上限时按过期时间从早到晚删"""
+        try:
+            db = self._db()
+            n = db.execute("DELETE FROM cache WHERE expires<=?", (time.time(),)).rowcount
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            while total > self.max_bytes:
+                rows = db.execute("SELECT ns, key, size FROM cache ORDER BY expires LIMIT 64").fetchall()
+                if not rows:
+                    break
+                db.executemany("DELETE FROM cache WHERE ns=? AND key=?", [(r[0], r[1]) for r in rows])
+                total -= sum(r[2] for r in rows)
+                n += len(rows)
+            db.execute("DELETE FROM flights WHERE until<=?", (time.time(),))
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning("共享缓存清理失败：%s", e)
+            return
+        with self._lock:
+            self.evictions += n
+
+    # ——— 跨进程合并 ——— #
+    def _claim(self, key: str) -> bool:
+        """占位成功返回 True；别的进程正在加载（占位未过期）返回 False"""
+        now = time.time()
+        try:
+            cur = self._db().execute(
+                "INSERT INTO flights VALUES (?, ?, ?) ON CONFLICT (ns, key) DO UPDATE SET until=excluded.until "
+                "WHERE flights.until<=?", (self.namespace, key, now + self.flight_wait, now))
+            return cur.rowcount == 1
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning("共享缓存占位失败：%s", e)
+            return True
+
+    def _release(self, key: str) -> None:
+        try:
+            self._db().execute("DELETE FROM flights WHERE ns=? AND key=?", (self.namespace, key))
+        except sqlite3.Error:
+            pass
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        """命中直接返回；没命中时同一时刻所有进程里只有一个在跑 loader（等不到结果才自己加载）"""
+        value = self._get(key)
+        if value is not _MISS:
+            self._count("hits")
+            return value
+        if not self._claim(key):
+            deadline = time.time() + self.flight_wait
+            while time.time() < deadline:
+                time.sleep(0.05)
+                value = self._get(key)
+                if value is not _MISS:
+                    self._count("coalesced")
+                    return value
+                if self._claim(key):                 # 对方失败或放弃了，轮到自己
+                    break
+        self._count("misses")
+        try:
+            value = loader()
+            self.put(key, value)
+            return value
+        finally:
+            self._release(key)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """删除本 namespace 的一个 key；不传 key 时清空本 namespace"""
+        try:
+            if key is None:
+                self._db().execute("DELETE FROM cache WHERE ns=?", (self.namespace,))
+            else:
+                self._db().execute("DELETE FROM cache WHERE ns=? AND key=?", (self.namespace, key))
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning("共享缓存删除失败：%s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            size, nbytes = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE ns=? AND expires>?",
+                (self.namespace, time.time())).fetchone()
+        except sqlite3.Error:
+            size = nbytes = -1
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": size,
+                "bytes": nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            }
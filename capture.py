@@ -0,0 +1,151 @@
+"""
+流量录制：收到的每条消息、发出的每条回复追加写入 gzip 压缩的 JSON Lines，供 bench/e2e.py --replay 回放
+————————————————————————————————————————————
+• 每行一个事件，t 为 time.time()：
+    {"ev": "start", "ai_name": ..., "listen": [...]}      每次开始监听写一条
+    {"ev": "in",  "who": 会话, "type": 消息类型, "content": 内容, "sender": 发送者}   图片消息的 content 是本地路径
+    {"ev": "out", "who": 会话, "text": 实际发出的文字}       合并发送时是合并后的整条
+• 轮询 / 发送线程只入队，压缩和写盘在后台线程；每 flush_interval 秒同步刷新一次，崩溃最多丢这么久的事件
+• 追加模式打开：同一文件可跨多次启动（gzip 多段拼接）。上次被杀留下的半截段在打开前截掉，
+  其中能解出的完整行重新压成一段写回，再接着追加；read() 逐段解压，坏段跳到下一个段头继续读
+• 录下的是聊天原文，只在明确指定文件时才开启
+"""
+import gzip
+import json
+import logging
+import queue
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+GZIP_MAGIC = b"\x1f\x8b\x08"
+CHUNK = 1 << 16
+
+
+class Recorder:
+    def __init__(self, path: Path, flush_interval: float = 1.0) -> None:
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self._q: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self.incoming_n = self.outgoing_n = self.errors = 0
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    # ——— 入队 ——— #
+    def start(self, **info: Any) -> None:
+        self._put({"ev": "start", **info})
+
+    def incoming(self, who: str, m: Any) -> None:
+        self.incoming_n += 1
+        self._put({"ev": "in", "who": who, "type": getattr(m, "type", ""),
+                   "content": getattr(m, "content", ""), "sender": getattr(m, "sender", "")})
+
+    def outgoing(self, who: str, text: str) -> None:
+        self.outgoing_n += 1
+        self._put({"ev": "out", "who": who, "text": text})
+
+    def _put(self, ev: Dict[str, Any]) -> None:
+        ev["t"] = round(time.time(), 3)
+        self._q.put(ev)
+
+    # ——— 写盘线程 ——— #
+    def _run(self) -> None:
+        try:
+            _repair(self.path)
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                dirty = False
+                while True:
+                    try:
+                        ev = self._q.get(timeout=self.flush_interval)
+                    except queue.Empty:
+                        if dirty:
+                            f.flush()
+                            dirty = False
+                        continue
+                    if ev is None:
+                        return
+                    f.write(json.dumps(ev, ensure_ascii=False) + "\n")
+                    dirty = True
+        except OSError as e:
+            self.errors += 1
+            logging.warning("流量录制写入失败 %s：%s", self.path, e)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """写完已排队的事件再关文件"""
+        self._q.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"file": str(self.path), "in": self.incoming_n, "out": self.outgoing_n, "errors": self.errors}
+
+
+def _members(raw: bytes) -> Iterator[Tuple[bytes, bool, int]]:
+    """
+    逐个 gzip 段解压 → (解出的内容, 是否完整, 段结束位置)。
+    段不完整或损坏时给出已解出的部分，然后从下一个段头继续；CRC 校验保证不会把坏段当成完整段。
+    """
+    pos = raw.find(GZIP_MAGIC)
+    while pos >= 0:
+        d = zlib.decompressobj(31)
+        out = []
+        end = pos
+        try:
+            while not d.eof and end < len(raw):
+                chunk = raw[end:end + CHUNK]
+                out.append(d.decompress(chunk))
+                end += len(chunk)
+        except zlib.error:
+            pass
+        if d.eof:
+            end -= len(d.unused_data)
+            yield b"".join(out), True, end
+            pos = raw.find(GZIP_MAGIC, end)
+        else:
+            yield b"".join(out), False, pos
+            pos = raw.find(GZIP_MAGIC, pos + 1)
+
+
+def _lines(data: bytes, complete: bool) -> Iterator[bytes]:
+    """不完整的段只要最后一个换行之前的部分"""
+    if not complete:
+        data = data[:data.rfind(b"\n") + 1]
+    for line in data.splitlines():
+        if line.strip():
+            yield line
+
+
+def _repair(path: Path) -> None:
+    """截掉文件末尾的半截 / 损坏数据；其中能解出的完整行压成新的一段接在后面"""
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError:
+        return
+    good = 0
+    salvaged = []
+    for data, complete, end in _members(raw):
+        if complete:
+            good = end
+            salvaged = []
+        else:
+            salvaged.extend(_lines(data, False))
+    if good == len(raw):
+        return
+    logging.warning("流量录制文件 %s 末尾不完整（上次异常退出），截掉 %d 字节，救回 %d 行",
+                    path, len(raw) - good, len(salvaged))
+    with open(path, "r+b") as f:
+        f.truncate(good)
+        f.seek(good)
+        if salvaged:
+            f.write(gzip.compress(b"\n".join(salvaged) + b"\n"))
+
+
+def read(path: Path) -> Iterator[Dict[str, Any]]:
+    """按写入顺序产出事件；截断 / 损坏的段读到哪算哪，后面完好的段照常读出"""
+    for data, complete, _ in _members(Path(path).read_bytes()):
+        for line in _lines(data, complete):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue                   # 坏段里解出的残行
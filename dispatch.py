@@ -0,0 +1,133 @@
+"""
+按会话保序的并发消息分发
+————————————————————————————————————————————
+• 同一个 key（chat.who）的消息严格按提交顺序串行处理
+• 不同 key 之间由 N 个 worker 并行处理
+• 每个 key 的队列有上限（满了拒收），全局在途数有上限（满了 submit 阻塞 = 背压）
+• key 轮转调度：worker 每次只从一个 key 取一条，处理完把 key 排回队尾，
+  刷屏的群不会独占 worker
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Set
+
+
+class Dispatcher:
+    def __init__(
+            self,
+            handler: Callable[[Any], None],
+            workers: int = 4,
+            per_key: int = 32,
+            max_pending: int = 256,
+            name: str = "dispatch"
+    ) -> None:
+        if workers < 1 or per_key < 1 or max_pending < 1:
+            raise ValueError("workers / per_key / max_pending 必须 ≥ 1")
+        self._handler = handler
+        self.per_key: int = per_key
+        self.max_pending: int = max_pending
+
+        self._lock = threading.Lock()
+        self._has_work = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._lanes: Dict[Hashable, Deque[Any]] = {}   # key → 待处理消息
+        self._ready: Deque[Hashable] = deque()          # 有消息且当前无人处理的 key
+        self._busy: Set[Hashable] = set()               # 正在被某个 worker 处理的 key
+        self._pending: int = 0
+        self._stopped: bool = False
+
+        self.processed: int = 0
+        self.rejected: int = 0
+        self.errors: int = 0
+
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key: Hashable, item: Any, timeout: Optional[float] = None) -> bool:
+        """
+        投递一条消息。全局在途数已满时阻塞等待（最多 timeout 秒）；
+        该 key 自己的队列已满、等待超时或已停止时返回 False。
+        """
+        with self._lock:
+            if not self._not_full.wait_for(
+                    lambda: self._stopped or self._pending < self.max_pending, timeout):
+                self.rejected += 1
+                return False
+            if self._stopped:
+                return False
+            lane = self._lanes.setdefault(key, deque())
+            if len(lane) >= self.per_key:
+                self.rejected += 1
+                return False
+            # lane 为空且无人处理 ⇔ key 不在 _ready 中
+            if not lane and key not in self._busy:
+                self._ready.append(key)
+                self._has_work.notify()
+            lane.append(item)
+            self._pending += 1
+            return True
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                self._has_work.wait_for(lambda: self._stopped or self._ready)
+                if self._stopped:
+                    return
+                key = self._ready.popleft()
+                self._busy.add(key)
+                item = self._lanes[key].popleft()
+
+            failed = False
+            try:
+                self._handler(item)
+            except Exception:
+                failed = True
+                logging.exception("消息处理异常 key=%s", key)
+
+            with self._lock:
+                self.errors += failed
+                self._busy.discard(key)
+                self._pending -= 1
+                self.processed += 1
+                lane = self._lanes.get(key)
+                if lane:
+                    self._ready.append(key)      # 排到队尾，给其他会话让路
+                    self._has_work.notify()
+                else:
+                    self._lanes.pop(key, None)
+                self._not_full.notify()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> int:
+        """停止 worker，丢弃尚未开始处理的消息，返回丢弃条数；正在处理的消息会跑完，总共最多等 timeout 秒"""
+        with self._lock:
+            self._stopped = True
+            dropped = self._pending - len(self._busy)
+            self._lanes.clear()
+            self._ready.clear()
+            self._pending = len(self._busy)
+            self._has_work.notify_all()
+            self._not_full.notify_all()
+        if dropped:
+            logging.info("分发器停止，丢弃 %d 条待处理消息", dropped)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return dropped
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "chats": len(self._lanes),
+                "busy": len(self._busy),
+                "processed": self.processed,
+                "rejected": self.rejected,
+                "errors": self.errors,
+            }
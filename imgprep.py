@@ -0,0 +1,149 @@
+"""
+多模态图片预处理：缩放 + 重新压缩 + 按内容哈希缓存
+————————————————————————————————————————————
+• 图片一到就在后台线程里处理，等 @AI 提问时结果通常已经就绪
+• 最长边缩到 max_side 以内，统一转成 JPEG(quality) ，手机原图一般能小一个数量级
+• 以文件内容 sha1 为键：同一张表情包转发到多个群只处理一次，磁盘上只存一份
+• 处理失败或超时就退回原图路径，不影响提问
+• 启动时把缓存目录里已有的文件按修改时间登记进 LRU，再按 max_entries 清理，跨重启也不会无限增长
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class ImagePrep:
+    def __init__(
+            self,
+            cache_dir: Path,
+            max_side: int = 1280,
+            quality: int = 85,
+            max_entries: int = 200,
+            workers: int = 2
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_side = max_side
+        self.quality = quality
+        self.max_entries = max_entries
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="imgprep")
+        self._lock = threading.Lock()
+        self._done: "OrderedDict[str, str]" = OrderedDict()     # sha1 → 处理后的路径
+        self._flights: Dict[str, Future] = {}                     # sha1 → 正在处理
+        self.hits = self.processed = self.failed = 0
+        self.bytes_in = self.bytes_out = 0
+        self._scan()
+
+    def _scan(self) -> None:
+        """登记之前运行留下的缓存文件（旧的在前），删掉写了一半的 .tmp，超出上限的按 LRU 清掉"""
+        try:
+            files = [(p.stat().st_mtime, p) for p in self.cache_dir.iterdir() if p.is_file()]
+        except OSError:
+            return
+        with self._lock:
+            for _, p in sorted(files):
+                if p.suffix == ".jpg":
+                    self._done[p.stem] = str(p)
+                elif p.suffix == ".tmp":
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+            self._evict()
+
+    def submit(self, path: str) -> Future:
+        """后台处理一张图，Future 的结果是处理后的路径（失败时为原路径）"""
+        return self._pool.submit(self._run, path)
+
+    def result(self, fut: Optional[Future], fallback: str, timeout: float = 5.0) -> str:
+        if fut is None:
+            return fallback
+        try:
+            return fut.result(timeout)
+        except Exception:
+            return fallback
+
+    def _run(self, path: str) -> str:
+        try:
+            data = Path(path).read_bytes()
+        except OSError as e:
+            logging.warning("读取图片失败 %s：%s", path, e)
+            return path
+        key = hashlib.sha1(data).hexdigest()
+
+        with self._lock:
+            out = self._done.get(key)
+            if out is not None and os.path.exists(out):
+                self._done.move_to_end(key)
+                self.hits += 1
+                return out
+            fut = self._flights.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._flights[key] = Future()
+        if not leader:
+            self.hits += 1
+            return fut.result() or path
+
+        out = None
+        try:
+            out = self._shrink(path, key, len(data))
+        except Exception as e:
+            self.failed += 1
+            logging.warning("图片预处理失败 %s：%s", path, e)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                if out:
+                    self._done[key] = out
+                    self._evict()
+            fut.set_result(out)
+        return out or path
+
+    def _shrink(self, path: str, key: str, size_in: int) -> str:
+        from PIL import Image, ImageOps
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        out = self.cache_dir / f"{key}.jpg"
+        with Image.open(path) as im:
+            im = ImageOps.exif_transpose(im)
+            if max(im.size) > self.max_side:
+                im.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+            if im.mode != "RGB":
+                bg = Image.new("RGB", im.size, "white")
+                bg.paste(im, mask=im.getchannel("A") if "A" in im.getbands() else None)
+                im = bg
+            tmp = out.with_suffix(".tmp")
+            im.save(tmp, "JPEG", quality=self.quality, optimize=True)
+        size_out = tmp.stat().st_size
+        if size_out >= size_in and path.lower().endswith((".jpg", ".jpeg")):
+            tmp.unlink()                 # 原图本来就更小，直接用原图
+            return path
+        os.replace(tmp, out)
+        with self._lock:
+            self.processed += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+        return str(out)
+
+    def _evict(self) -> None:
+        """调用方需持有锁；超出上限时删除最久未用的缓存文件"""
+        while len(self._done) > self.max_entries:
+            _, old = self._done.popitem(last=False)
+            if Path(old).parent == self.cache_dir:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cached": len(self._done), "hits": self.hits, "processed": self.processed,
+                    "failed": self.failed, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
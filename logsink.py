@@ -0,0 +1,99 @@
+"""
+日志汇聚：界面日志面板按帧批量渲染 + 后台线程写滚动日志文件
+————————————————————————————————————————————
+• emit() 只做两件事：追加到有界的界面缓冲区、交给 logging；调用方（轮询 / 处理线程）几乎不花时间
+• 文件写入由 QueueListener 的后台线程完成，按大小滚动（bot.log → bot.log.1 …），界面裁掉的行在文件里都有
+• drain() 供界面定时取走一帧要显示的行：超出上限时只给最新的若干行，并报告省略了几行
+• 级别按前缀推断：⚠️ → WARNING，❌ → ERROR，其余 INFO
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Deque, List, Optional, Tuple
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATEFMT = "%Y-%m-%d %H:%M:%S"
+
+
+def _level(text: str) -> int:
+    if text.startswith("❌"):
+        return logging.ERROR
+    if text.startswith("⚠️"):
+        return logging.WARNING
+    return logging.INFO
+
+
+class LogSink:
+    def __init__(
+            self,
+            path: Optional[Path] = None,
+            max_bytes: int = 5 << 20,
+            backups: int = 3,
+            ui_lines: int = 0,
+            capture_root: bool = False
+    ) -> None:
+        """
+        path：滚动日志文件，None 表示不写文件（事件仍交给 logging，由调用方的配置决定去向）；
+        ui_lines：界面缓冲区最多积压几行，0 表示没有界面；
+        capture_root：把根 logger 也接到这个文件（--headless 时 ai.py 等模块的日志一并落盘）。
+        """
+        self._logger = logging.getLogger("wxbot")
+        self._ui: Optional[Deque[str]] = deque(maxlen=ui_lines) if ui_lines else None
+        self._lock = threading.Lock()
+        self._skipped = 0                      # 界面来不及显示、被挤出缓冲区的行数
+        self._listener: Optional[QueueListener] = None
+        self._handler: Optional[QueueHandler] = None
+        self._target: Optional[logging.Logger] = None
+        if path is None:
+            return
+
+        fh = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        fh.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATEFMT))
+        q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self._listener = QueueListener(q, fh)
+        self._listener.start()
+        self._handler = QueueHandler(q)
+        self._target = logging.getLogger() if capture_root else self._logger
+        self._target.addHandler(self._handler)
+        if capture_root:
+            self._target.setLevel(logging.INFO)
+        else:
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False     # 界面模式下事件只进面板和文件，不再刷终端
+
+    def emit(self, text: str) -> None:
+        if self._ui is not None:
+            line = f"{time.strftime('%H:%M:%S')} {text}"
+            with self._lock:
+                if len(self._ui) == self._ui.maxlen:
+                    self._skipped += 1
+                self._ui.append(line)
+        self._logger.log(_level(text), text)
+
+    def drain(self, limit: int) -> Tuple[List[str], int]:
+        """取走待显示的行，最多 limit 行（取最新的）；返回 (行, 省略的行数)"""
+        if self._ui is None:
+            return [], 0
+        with self._lock:
+            lines = list(self._ui)
+            self._ui.clear()
+            skipped, self._skipped = self._skipped, 0
+        if len(lines) > limit:
+            skipped += len(lines) - limit
+            lines = lines[-limit:]
+        return lines, skipped
+
+    def close(self) -> None:
+        """把已排队的事件写完再关文件"""
+        if self._listener is None:
+            return
+        if self._target is not None and self._handler is not None:
+            self._target.removeHandler(self._handler)
+        self._listener.stop()
+        for h in self._listener.handlers:
+            h.close()
+        self._listener = None
@@ -0,0 +1,185 @@
+"""
+分阶段耗时统计 + Prometheus 文本导出
+————————————————————————————————————————————
+• with timed("fetch"): ...   记录一次耗时；inc("msg_ai") 计数
+• 耗时落在固定的指数桶里（10 µs ~ 2 min，每档 ×1.25），记录一次只是一次二分 + 加一
+• 分位数取最近 WINDOW_SLOTS × SLOT_SECONDS 秒的滚动窗口；count / sum 从启动累计
+• export_to(path) 后台定期把 prometheus() 文本原子地写入文件，供 textfile 采集器读取
+• gauge 回调可能不便宜（遍历会话表、数据库 COUNT），sample_gauges() 在后台线程定期算好，
+  界面用 counters(cached=True) 只读最近一次的结果，不在界面线程里调回调
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+SLOT_SECONDS = 60
+WINDOW_SLOTS = 5
+QUANTILES = (0.5, 0.95, 0.99)
+
+_BOUNDS: List[float] = []
+_b = 0.00001
+while _b < 120:
+    _BOUNDS.append(_b)
+    _b *= 1.25
+_BOUNDS.append(float("inf"))
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self._slots: List[Tuple[int, List[int]]] = [(-1, [0] * len(_BOUNDS)) for _ in range(WINDOW_SLOTS)]
+
+    def observe(self, seconds: float, now: float) -> None:
+        """调用方需持有锁"""
+        self.count += 1
+        self.sum += seconds
+        sid = int(now // SLOT_SECONDS)
+        i = sid % WINDOW_SLOTS
+        if self._slots[i][0] != sid:
+            self._slots[i] = (sid, [0] * len(_BOUNDS))
+        self._slots[i][1][bisect.bisect_left(_BOUNDS, seconds)] += 1
+
+    def window(self, now: float) -> List[int]:
+        sid = int(now // SLOT_SECONDS)
+        merged = [0] * len(_BOUNDS)
+        for s, counts in self._slots:
+            if sid - s < WINDOW_SLOTS:
+                merged = [a + b for a, b in zip(merged, counts)]
+        return merged
+
+    @staticmethod
+    def quantile(counts: List[int], q: float) -> float:
+        """返回所在桶的上界（最后一档取前一档上界）"""
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank, acc = q * total, 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= rank:
+                return _BOUNDS[min(i, len(_BOUNDS) - 2)]
+        return _BOUNDS[-2]
+
+
+class Metrics:
+    def __init__(self, prefix: str = "wxbot") -> None:
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._hists: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._gauges: List[Callable[[], Dict[str, float]]] = []
+        self._gauge_cache: Dict[str, float] = {}
+        self._exporting = self._sampling = False
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            h = self._hists.get(stage)
+            if h is None:
+                h = self._hists[stage] = Histogram()
+            h.observe(seconds, time.time())
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def inc(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauges(self, fn: Callable[[], Dict[str, float]]) -> None:
+        """注册一个返回 {名字: 数值} 的回调，导出时调用（如缓存命中数、队列深度）"""
+        self._gauges.append(fn)
+
+    def _gauge_values(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        for fn in self._gauges:
+            try:
+                out.update({k: v for k, v in fn().items() if isinstance(v, (int, float))})
+            except Exception:
+                pass
+        self._gauge_cache = out
+        return out
+
+    def sample_gauges(self, interval: float = 2.0) -> None:
+        """后台线程每 interval 秒算一次所有 gauge；重复调用无副作用"""
+        if self._sampling:
+            return
+        self._sampling = True
+
+        def run() -> None:
+            while True:
+                self._gauge_values()
+                time.sleep(interval)
+
+        threading.Thread(target=run, name="metrics-gauges", daemon=True).start()
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """阶段 → {count, sum, window, p50, p95, p99}（秒）"""
+        now = time.time()
+        with self._lock:
+            out = {}
+            for stage, h in sorted(self._hists.items()):
+                w = h.window(now)
+                row = {"count": h.count, "sum": h.sum, "window": sum(w)}
+                for q in QUANTILES:
+                    row[f"p{int(q * 100)}"] = Histogram.quantile(w, q)
+                out[stage] = row
+            return out
+
+    def counters(self, cached: bool = False) -> Dict[str, float]:
+        """计数 + gauge；cached=True 时 gauge 用最近一次算好的值（见 sample_gauges），不调回调"""
+        with self._lock:
+            c = dict(self._counters)
+        c.update(self._gauge_cache if cached else self._gauge_values())
+        return c
+
+    def prometheus(self) -> str:
+        p = self.prefix
+        lines = [f"# HELP {p}_stage_seconds Per-stage latency, quantiles over the last "
+                 f"{SLOT_SECONDS * WINDOW_SLOTS}s",
+                 f"# TYPE {p}_stage_seconds summary"]
+        for stage, row in self.snapshot().items():
+            for q in QUANTILES:
+                lines.append(f'{p}_stage_seconds{{stage="{stage}",quantile="{q}"}} {row[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {row["sum"]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {row["count"]}')
+        with self._lock:
+            counters = dict(self._counters)
+        for name, v in sorted(counters.items()):
+            lines += [f"# TYPE {p}_{name}_total counter", f"{p}_{name}_total {v}"]
+        for name, v in sorted(self._gauge_values().items()):
+            lines += [f"# TYPE {p}_{name} gauge", f"{p}_{name} {v}"]
+        return "\n".join(lines) + "\n"
+
+    def export_to(self, path: str, interval: float = 15.0) -> None:
+        """后台线程每 interval 秒重写一次 path；重复调用无副作用"""
+        if self._exporting:
+            return
+        self._exporting = True
+
+        def run() -> None:
+            while True:
+                tmp = f"{path}.tmp"
+                try:
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        f.write(self.prometheus())
+                    os.replace(tmp, path)
+                except OSError:
+                    pass
+                time.sleep(interval)
+
+        threading.Thread(target=run, name="metrics-export", daemon=True).start()
+
+
+# —— 进程内共用一个实例 —— #
+metrics = Metrics()
+timed = metrics.timer
+inc = metrics.inc
@@ -0,0 +1,206 @@
+"""
+发送队列：令牌桶限速 + 优先级 + 同会话合并
+————————————————————————————————————————————
+• 所有回复先进队列，由唯一的发送线程调用 SendMsg（wxauto 是 UI 自动化，本来就只能串行）
+• 每个会话一个令牌桶，全局再一个：群里刷屏时不会连发被微信限流，也不会拖慢界面
+• 优先级：PRIO_HIGH（关键词 / 命令应答）先于 PRIO_NORMAL（AI）先于 PRIO_LOW（车票结果 / 推送）；
+  同一优先级内严格按入队顺序
+• 轮到某会话发送时，把它排队中的后续消息拼成一条（不超过 max_chars），少发几条
+• chat 只需有 who 属性和 SendMsg(text) 方法，基准测试里换成假对象即可
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+PRIO_HIGH, PRIO_NORMAL, PRIO_LOW = 0, 1, 2
+
+
+class TokenBucket:
+    """rate 个/秒，最多攒 burst 个；非线程安全，由调用方加锁"""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._t = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def wait_time(self, now: float) -> float:
+        """还要等几秒才有令牌（0 表示现在就有）"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Item:
+    __slots__ = ("prio", "seq", "text", "t_put", "on_sent")
+
+    def __init__(self, prio: int, seq: int, text: str, on_sent: Optional[Callable[[float], None]]) -> None:
+        self.prio = prio
+        self.seq = seq
+        self.text = text
+        self.t_put = time.perf_counter()
+        self.on_sent = on_sent
+
+    def __lt__(self, other: "_Item") -> bool:
+        return (self.prio, self.seq) < (other.prio, other.seq)
+
+
+class _Lane:
+    __slots__ = ("chat", "heap", "bucket")
+
+    def __init__(self, chat: Any, bucket: TokenBucket) -> None:
+        self.chat = chat
+        self.heap: List[_Item] = []
+        self.bucket = bucket
+
+
+class Outbox:
+    def __init__(
+            self,
+            send: Optional[Callable[[Any, str], None]] = None,
+            rate: float = 5.0,
+            burst: float = 10,
+            chat_rate: float = 1.0,
+            chat_burst: float = 3,
+            max_chars: int = 800,
+            max_pending: int = 1000
+    ) -> None:
+        """
+        send(chat, text) 真正发出一条消息，默认 chat.SendMsg(text)；
+        rate / burst 为全局令牌桶，chat_rate / chat_burst 为每个会话的令牌桶。
+        """
+        self.send = send or (lambda chat, text: chat.SendMsg(text))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chars = max_chars
+        self.max_pending = max_pending
+        self._global = TokenBucket(rate, burst)
+        self._lanes: Dict[Any, _Lane] = {}
+        self._seq = itertools.count()
+        self._cv = threading.Condition()
+        self._pending = 0
+        self._running = False
+        self._gen = 0                 # 每次 start 加一，旧的发送线程看到后自行退出
+        self.sent = self.merged = self.dropped = self.errors = 0
+
+    # ——— 入队 ——— #
+    def put(self, chat: Any, text: str, prio: int = PRIO_NORMAL,
+            on_sent: Optional[Callable[[float], None]] = None) -> bool:
+        """
+        排队发送；未启动 / 已停止或队列已满时丢弃并返回 False。
+        on_sent(发出时刻 perf_counter) 在这条消息实际发出后回调（合并发送时每条都会回调）。
+        """
+        if not text:
+            return True
+        key = getattr(chat, "who", None) or id(chat)
+        with self._cv:
+            if not self._running or self._pending >= self.max_pending:     # 停止后晚到的回复不留到下次启动
+                self.dropped += 1
+                return False
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane(chat, TokenBucket(self.chat_rate, self.chat_burst))
+            lane.chat = chat
+            heapq.heappush(lane.heap, _Item(prio, next(self._seq), text, on_sent))
+            self._pending += 1
+            self._cv.notify()
+        return True
+
+    # ——— 发送线程 ——— #
+    def start(self) -> None:
+        with self._cv:
+            if self._running:
+                return
+            self._running = True
+            self._gen += 1
+            gen = self._gen
+        threading.Thread(target=self._run, args=(gen,), name="outbox", daemon=True).start()
+
+    def stop(self, drain: float = 0.0) -> int:
+        """最多等 drain 秒把队列发完，剩下的丢弃，返回丢弃条数"""
+        deadline = time.monotonic() + drain
+        with self._cv:
+            while self._pending and time.monotonic() < deadline:
+                self._cv.wait(deadline - time.monotonic())
+            self._running = False
+            dropped = self._pending
+            self.dropped += dropped
+            self._pending = 0
+            self._lanes.clear()
+            self._cv.notify_all()
+        return dropped
+
+    def _pick(self, now: float) -> Tuple[Optional[_Lane], float]:
+        """调用方需持有锁；选出可以发送、队首优先级最高的会话，或返回需要等待的秒数"""
+        best: Optional[_Lane] = None
+        wait = 60.0
+        for lane in self._lanes.values():
+            if not lane.heap:
+                continue
+            w = lane.bucket.wait_time(now)
+            if w > 0:
+                wait = min(wait, w)
+            elif best is None or lane.heap[0] < best.heap[0]:
+                best = lane
+        if best is None:
+            return None, wait
+        w = self._global.wait_time(now)
+        return (best, 0.0) if w <= 0 else (None, w)
+
+    def _run(self, gen: int) -> None:
+        while True:
+            with self._cv:
+                if not self._running or gen != self._gen:
+                    return
+                if not self._pending:
+                    self._cv.wait()
+                    continue
+                now = time.monotonic()
+                lane, wait = self._pick(now)
+                if lane is None:
+                    self._cv.wait(wait)
+                    continue
+                lane.bucket.take(now)
+                self._global.take(now)
+                items = [heapq.heappop(lane.heap)]
+                size = len(items[0].text)
+                while lane.heap and size + 1 + len(lane.heap[0].text) <= self.max_chars:
+                    items.append(heapq.heappop(lane.heap))
+                    size += 1 + len(items[-1].text)
+                self._pending -= len(items)
+                self.merged += len(items) - 1
+                chat = lane.chat        # 队列空了也保留 lane：令牌桶状态要延续，否则限速形同虚设
+                self._cv.notify_all()
+
+            try:
+                self.send(chat, "\n".join(it.text for it in items))
+            except Exception as e:
+                self.errors += 1
+                logging.warning("发送失败 %s：%s", getattr(chat, "who", chat), e)
+                continue
+            t = time.perf_counter()
+            self.sent += 1
+            for it in items:
+                metrics.observe("outbox_wait", t - it.t_put)
+                if it.on_sent:
+                    try:
+                        it.on_sent(t)
+                    except Exception:
+                        pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._cv:
+            return {"pending": self._pending, "chats": sum(1 for l in self._lanes.values() if l.heap), "sent": self.sent,
+                    "merged": self.merged, "dropped": self.dropped, "errors": self.errors}
@@ -0,0 +1,90 @@
+"""
+GetListenMessage 的自适应轮询间隔
+————————————————————————————————————————————
+• 拉到消息：进入突发模式，下一次几乎立刻再拉（群里刷屏时消息一般是一串一串来的）
+• 连续空轮询 idle_after 次后开始按 growth 倍放慢，最多到 idle_max；一有消息立刻回到 fast
+• 出错按异常类型选基础等待时长，连续出错指数退避，再乘 [0.5, 1] 的随机抖动，避免和微信一起抖
+• 不自己开线程：调用方每轮调用 after_batch / after_error 拿到下一次要等的秒数
+• stats()：轮询次数、空轮询比例、错误数、当前间隔、轮询线程每小时 CPU 秒数
+"""
+import random
+import threading
+import time
+from typing import Dict, Tuple, Type, Union
+
+# 异常类型 → 基础重试等待（秒）；按 isinstance 顺序匹配，都不匹配用 error_default
+ERROR_DELAYS: Tuple[Tuple[Type[BaseException], float], ...] = (
+    (TimeoutError, 0.5),        # UI 自动化偶发超时，很快就能恢复
+    (ConnectionError, 1.0),
+    (LookupError, 2.0),         # 找不到控件：窗口被遮挡 / 切走，多等一会儿
+    (OSError, 2.0),             # COM 调用失败等
+)
+
+
+class AdaptivePoller:
+    def __init__(
+            self,
+            fast: float = 0.1,
+            burst: float = 0.02,
+            idle_max: float = 1.5,
+            idle_after: int = 10,
+            growth: float = 1.5,
+            error_default: float = 3.0,
+            error_max: float = 60.0
+    ) -> None:
+        """
+        fast：平时的间隔；burst：刚拉到消息后的间隔；idle_max：长期空闲时放宽到的上限。
+        error_default / error_max：未归类异常的基础等待 / 退避上限。
+        """
+        self.fast = fast
+        self.burst = burst
+        self.idle_max = max(idle_max, fast)
+        self.idle_after = idle_after
+        self.growth = growth
+        self.error_default = error_default
+        self.error_max = error_max
+        self.interval = fast
+        self._lock = threading.Lock()
+        self._empty_run = 0
+        self._fail_run = 0
+        self._t0 = time.monotonic()
+        self._cpu = 0.0
+        self.polls = self.empty = self.messages = self.errors = 0
+
+    def after_batch(self, n: int, cpu: float = 0.0) -> float:
+        """一次轮询拉到 n 条消息（cpu：这一轮轮询线程花的 CPU 秒数）→ 下一次要等几秒"""
+        with self._lock:
+            self.polls += 1
+            self._cpu += cpu
+            self._fail_run = 0
+            if n:
+                self.messages += n
+                self._empty_run = 0
+                self.interval = self.fast
+                return self.burst
+            self.empty += 1
+            self._empty_run += 1
+            if self._empty_run > self.idle_after:
+                self.interval = min(self.idle_max, self.interval * self.growth)
+            return self.interval
+
+    def after_error(self, e: BaseException, cpu: float = 0.0) -> float:
+        """轮询抛了异常 → 下一次要等几秒"""
+        base = next((d for t, d in ERROR_DELAYS if isinstance(e, t)), self.error_default)
+        with self._lock:
+            self.polls += 1
+            self.errors += 1
+            self._cpu += cpu
+            self._fail_run += 1
+            self._empty_run = 0
+            self.interval = self.fast          # 恢复后先按平时的节奏
+            delay = min(self.error_max, base * 2 ** (self._fail_run - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            hours = max(time.monotonic() - self._t0, 1e-9) / 3600
+            return {"polls": self.polls, "empty": self.empty, "messages": self.messages, "errors": self.errors,
+                    "empty_ratio": round(self.empty / self.polls, 3) if self.polls else 0.0,
+                    "interval_ms": round(self.interval * 1000), "polls_per_hour": round(self.polls / hours),
+                    "cpu_s_per_hour": round(self._cpu / hours, 2)}
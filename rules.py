@@ -0,0 +1,117 @@
+"""
+关键词自动回复规则引擎（Aho-Corasick 多模式匹配）
+————————————————————————————————————————————
+• 全局规则（w 为空）一个自动机，每个指定好友各一个自动机
+• 匹配一次扫描文本即可，代价与规则数无关；命中多条时取添加顺序最靠前的一条，
+  与原来顺序遍历 mapping_list 的“第一条命中”语义一致
+• add() 只让对应的那一个自动机失效，下次匹配时重建；已建好的自动机只读，可多线程共用
+• 规则很少时逐字扫描反而比 C 实现的 `in` 慢，少于 _LINEAR_MAX 条的作用域直接顺序比较
+"""
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+Rule = Tuple[str, str, str]          # (指定好友, 关键词, 回复)
+_NONE = 1 << 62                      # 没有命中
+_LINEAR_MAX = 64                     # 见 bench/bench_rules.py，约 100 条时两者持平
+
+
+class _Automaton:
+    """只读的 AC 自动机；best[s] = 状态 s 及其后缀链上命中规则的最小序号"""
+    __slots__ = ("goto", "fail", "best")
+
+    def __init__(self, patterns: List[Tuple[str, int]]) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        best: List[int] = [_NONE]
+        for word, idx in patterns:
+            s = 0
+            for ch in word:
+                nxt = goto[s].get(ch)
+                if nxt is None:
+                    nxt = goto[s][ch] = len(goto)
+                    goto.append({})
+                    best.append(_NONE)
+                s = nxt
+            if idx < best[s]:
+                best[s] = idx
+
+        fail = [0] * len(goto)
+        q = deque(goto[0].values())
+        for s in q:
+            if best[0] < best[s]:            # 空关键词命中一切
+                best[s] = best[0]
+        while q:
+            r = q.popleft()
+            for ch, s in goto[r].items():
+                q.append(s)
+                f = fail[r]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[s] = goto[f].get(ch, 0) if goto[f].get(ch) != s else 0
+                if best[fail[s]] < best[s]:
+                    best[s] = best[fail[s]]
+        self.goto, self.fail, self.best = goto, fail, best
+
+    def first(self, text: str) -> int:
+        goto, fail, best = self.goto, self.fail, self.best
+        s, hit = 0, best[0]
+        for ch in text:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if best[s] < hit:
+                hit = best[s]
+        return hit
+
+
+class _Linear:
+    """规则少时的顺序比较，语义同 _Automaton.first"""
+    __slots__ = ("patterns",)
+
+    def __init__(self, patterns: List[Tuple[str, int]]) -> None:
+        self.patterns = list(patterns)
+
+    def first(self, text: str) -> int:
+        for word, idx in self.patterns:
+            if word in text:
+                return idx
+        return _NONE
+
+
+class KeywordRules:
+    def __init__(self, rules: Iterable[Rule] = ()) -> None:
+        self._rules: List[Rule] = []
+        self._patterns: Dict[str, List[Tuple[str, int]]] = {}   # 好友（"" = 全局）→ [(关键词, 序号)]
+        self._compiled: Dict[str, object] = {}                   # 好友 → _Automaton / _Linear
+        self._lock = threading.Lock()
+        for w, k, r in rules:
+            self.add(w, k, r)
+
+    def add(self, who: str, keyword: str, reply: str) -> None:
+        with self._lock:
+            self._patterns.setdefault(who, []).append((keyword, len(self._rules)))
+            self._rules.append((who, keyword, reply))
+            self._compiled.pop(who, None)
+
+    def _automaton(self, who: str):
+        ac = self._compiled.get(who)
+        if ac is None and who in self._patterns:
+            with self._lock:
+                ac = self._compiled.get(who)
+                if ac is None:
+                    pats = self._patterns[who]
+                    ac = _Linear(pats) if len(pats) < _LINEAR_MAX else _Automaton(pats)
+                    self._compiled[who] = ac
+        return ac
+
+    def match(self, who: str, text: str) -> Optional[Rule]:
+        """返回第一条（按添加顺序）适用于 who 且关键词出现在 text 中的规则"""
+        hit = _NONE
+        for scope in ("", who) if who else ("",):
+            ac = self._automaton(scope)
+            if ac is not None:
+                hit = min(hit, ac.first(text))
+        return self._rules[hit] if hit != _NONE else None
+
+    def __len__(self) -> int:
+        return len(self._rules)
@@ -0,0 +1,202 @@
+"""
+12306 站名索引
+————————————————————————————————————————————
+• 支持 站名 / 去掉“站”字 / 全拼 / 简拼(alias) / code / 电报码 精确匹配
+• 电报码单独建表：三个大写字母先按电报码查（有 771 个站的 code 与别的站的电报码相同），
+  by_telecode() 只按电报码查，给 12306 返回的车站码用
+• 唯一前缀匹配（“上海虹” → 上海虹桥，“shanghaih” → 上海虹桥）
+• 查不到时按 前缀 > 同城 > 编辑距离 给出排序后的候选
+• 首次加载把 .1.json 编译成 marshal 列存缓存，源文件没变就直接读缓存，不再解析 JSON
+"""
+import bisect
+import json
+import logging
+import marshal
+import os
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# 缓存格式变更时改这个版本号，旧缓存会自动重建
+_CACHE_VERSION = 2
+_FIELDS = ("station_name", "station_telecode", "pinyin", "alias", "code", "province", "region_code", "index")
+
+
+class Station(NamedTuple):
+    name: str
+    telecode: str
+    pinyin: str
+    alias: str
+    code: str
+    province: str
+    region_code: str
+    rank: int          # 12306 原始 index：表里的行号（按区域、区域内大体按拼音排），只作同分时的稳定次序，不代表常用程度
+
+
+def _norm(q: str) -> str:
+    return "".join(q.split()).lower()
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """带上限的 Levenshtein 距离；超过 limit 时返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+class StationIndex:
+    def __init__(self, stations: List[Station], tables: Optional[tuple] = None) -> None:
+        self.stations: List[Station] = stations
+        self._tele: Dict[str, int]              # 电报码（大写）→ 下标
+        self._exact: Dict[str, int]             # 站名 / 电报码 / code → 下标
+        self._spell: Dict[str, List[int]]       # 全拼 / 简拼 → 下标（可能重名）
+        self._province: Dict[str, List[int]]
+        self._keys: List[str]                   # 前缀检索用的有序键（站名 + 全拼）
+        self._ids: List[int]                    # 与 _keys 一一对应的下标
+        self._tele, self._exact, self._spell, self._province, self._keys, self._ids = tables or self._build(stations)
+
+    @staticmethod
+    def _build(stations: List[Station]) -> tuple:
+        tele = {s.telecode: i for i, s in enumerate(stations)}
+        exact: Dict[str, int] = {}
+        spell: Dict[str, List[int]] = {}
+        province: Dict[str, List[int]] = {}
+        for i, s in enumerate(stations):
+            exact.setdefault(s.name, i)
+            exact.setdefault(s.telecode.lower(), i)
+            exact.setdefault(s.code.lower(), i)
+            for k in {s.pinyin.lower(), s.alias.lower()}:
+                if k:
+                    spell.setdefault(k, []).append(i)
+            province.setdefault(s.province, []).append(i)
+        pairs = sorted(
+            {(s.name, i) for i, s in enumerate(stations)} |
+            {(s.pinyin.lower(), i) for i, s in enumerate(stations) if s.pinyin}
+        )
+        return tele, exact, spell, province, [k for k, _ in pairs], [i for _, i in pairs]
+
+    # —— 构建 / 缓存 —— #
+    @classmethod
+    def from_json(cls, path: Path) -> "StationIndex":
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f).get("Sheet1", [])
+        return cls([cls._row(r) for r in rows])
+
+    @staticmethod
+    def _row(r: Dict[str, str]) -> Station:
+        name, tele, py, alias, code, prov, region, idx = (r.get(k, "") for k in _FIELDS)
+        return Station(name, tele, py, alias, code, prov, region, int(idx or 0))
+
+    @classmethod
+    def load(cls, path: Path, cache: Optional[Path] = None) -> "StationIndex":
+        """
+        优先读编译缓存（站点列 + 已建好的检索表）；
+        缓存缺失、与源文件大小 / 修改时间不符或损坏时解析 JSON 并重写缓存
+        """
+        if cache is None:
+            return cls.from_json(path)
+        st = os.stat(path)
+        stamp = (_CACHE_VERSION, st.st_size, st.st_mtime_ns)
+        try:
+            head, cols, tables = marshal.loads(Path(cache).read_bytes())
+            if tuple(head) == stamp:
+                return cls(list(map(Station._make, zip(*cols))), tables)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning("站名缓存损坏，重新生成：%s", e)
+
+        idx = cls.from_json(path)
+        bad = idx.mismatched()
+        if bad:
+            logging.warning("%d 个电报码查不回本站：%s", len(bad), " ".join(x.telecode for x in bad[:10]))
+        cols = tuple(tuple(col) for col in zip(*idx.stations))
+        tmp = Path(f"{cache}.tmp")
+        try:
+            tmp.write_bytes(marshal.dumps((stamp, cols, idx._tables())))
+            os.replace(tmp, cache)
+        except OSError as e:
+            logging.warning("写入站名缓存失败：%s", e)
+        return idx
+
+    def _tables(self) -> tuple:
+        return self._tele, self._exact, self._spell, self._province, self._keys, self._ids
+
+    # —— 查询 —— #
+    def _prefixed(self, q: str) -> List[int]:
+        lo = bisect.bisect_left(self._keys, q)
+        hi = bisect.bisect_right(self._keys, q + "\uffff")
+        return sorted(set(self._ids[lo:hi]), key=lambda i: self.stations[i].rank)
+
+    def find(self, query: str) -> Optional[Station]:
+        """精确匹配各字段，其次去掉“站”字，最后接受唯一前缀；匹配不到返回 None"""
+        q = _norm(query)
+        if not q:
+            return None
+        if len(q) == 3 and query.strip().isupper() and q.upper() in self._tele:
+            return self.stations[self._tele[q.upper()]]
+        for k in (q, q[:-1] if q.endswith("站") else None):
+            if not k:
+                continue
+            if k in self._exact:
+                return self.stations[self._exact[k]]
+            hits = self._spell.get(k)
+            if hits:
+                return self.stations[min(hits, key=lambda i: self.stations[i].rank)]
+        pre = self._prefixed(q.rstrip("站"))
+        return self.stations[pre[0]] if len(pre) == 1 else None
+
+    def by_telecode(self, telecode: str) -> Optional[Station]:
+        """只按电报码精确查（12306 返回的 from / to 站码）"""
+        i = self._tele.get(telecode.upper())
+        return self.stations[i] if i is not None else None
+
+    def mismatched(self) -> List[Station]:
+        """find(电报码) 不是该站本身的车站；正常应为空"""
+        return [s for s in self.stations if self.find(s.telecode) is not s]
+
+    def code(self, query: str) -> str:
+        s = self.find(query)
+        return s.telecode if s else ""
+
+    def by_province(self, province: str) -> List[Station]:
+        return [self.stations[i] for i in self._province.get(province, [])]
+
+    def expand(self, query: str, limit: int = 8) -> List[Station]:
+        """“上海*” → 站名以“上海”开头的车站（按表中顺序）；其余同 find()。找不到返回空列表"""
+        if not query.endswith("*"):
+            s = self.find(query)
+            return [s] if s else []
+        q = _norm(query[:-1]).rstrip("站")
+        return [self.stations[i] for i in self._prefixed(q) if self.stations[i].name.startswith(q)][:limit]
+
+    def suggest(self, query: str, limit: int = 5) -> List[Station]:
+        """候选排序：前缀匹配 → 同城车站 → 编辑距离（站名 / 全拼）"""
+        q = _norm(query).rstrip("站")
+        if not q:
+            return []
+        seen: Dict[int, Tuple[int, int, int]] = {}
+
+        def add(i: int, score: Tuple[int, int, int]) -> None:
+            if i not in seen or score < seen[i]:
+                seen[i] = score
+
+        for i in self._prefixed(q):
+            add(i, (0, len(self.stations[i].name), self.stations[i].rank))
+        for i in self._province.get(q, []):
+            add(i, (1, 0, self.stations[i].rank))
+        limit_d = 1 if len(q) <= 3 else 2
+        for i, s in enumerate(self.stations):
+            keys = (s.pinyin.lower(), s.alias.lower()) if q.isascii() else (s.name,)
+            d = min(_edit_distance(q, k, limit_d) for k in keys)
+            if d <= limit_d:
+                add(i, (2, d, s.rank))
+        ranked = sorted(seen, key=lambda i: seen[i])
+        return [self.stations[i] for i in ranked[:limit]]
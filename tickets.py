@@ -0,0 +1,240 @@
+"""
+12306 leftTicket 结果的列式解析、筛选、排序与分页
+————————————————————————————————————————————
+• Trains.parse 把 "|" 分隔的原始行解析成按列存放的定长列表：车次 / 站 / 时刻 / 历时(分钟) / 各席位余量
+• 余量统一成 int（具体张数）、"有"、"无" 或 None（该车不设此席别）
+• select() 按车型前缀、出发时间窗、是否有票筛选，按出发 / 到达 / 历时排序，返回行号
+• render() 按固定趟数分页，Pager 记住每个会话剩下的页，“下一页”直接从内存里取，不再查询
+"""
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from cache import TTLCache
+
+SeatValue = Union[int, str, None]
+
+# (席别, 回复里的简称, 原始行字段下标)
+SEATS: Tuple[Tuple[str, str, int], ...] = (
+    ("商务", "商", 32), ("一等", "①", 31), ("二等", "②", 30), ("软卧", "软", 23),
+    ("硬卧", "硬卧", 28), ("硬座", "硬座", 29), ("无座", "无座", 26),
+)
+SEAT_NAMES = tuple(s[0] for s in SEATS)
+SEAT_ALIASES: Dict[str, str] = {"商务座": "商务", "商": "商务", "一等座": "一等", "二等座": "二等",
+                                "软": "软卧", "硬卧铺": "硬卧", "站票": "无座"}
+TRAIN_TYPES: Dict[str, str] = {"高铁": "G", "动车": "D", "城际": "C", "直达": "Z", "特快": "T", "快速": "K"}
+SORT_KEYS: Dict[str, str] = {"按出发": "dep", "按到达": "arr", "按历时": "dur", "按时长": "dur", "最快": "dur"}
+
+_WINDOW_RE = re.compile(r"^(\d{1,2})(?:[:：](\d{2}))?点?[-~～到至](\d{1,2})(?:[:：](\d{2}))?点?$")
+
+
+def seat_name(s: str) -> Optional[str]:
+    """席别别名 → 标准名；不认识返回 None"""
+    s = SEAT_ALIASES.get(s, s)
+    return s if s in SEAT_NAMES else None
+
+
+def _seat(v: str) -> SeatValue:
+    if v in ("", "--", "*"):
+        return None
+    return int(v) if v.isdigit() else v
+
+
+def _minutes(hhmm: str) -> int:
+    h, _, m = hhmm.partition(":")
+    return int(h) * 60 + int(m) if h.isdigit() and m.isdigit() else 0
+
+
+def has_ticket(v: SeatValue) -> bool:
+    return v == "有" or (isinstance(v, int) and v > 0)
+
+
+class Trains:
+    """
+    列式存放的车次表；同一下标 i 在各列里对应同一趟车。
+    多次 add_result() 合并多个查询结果，按 (日期, 车次, 上车站, 下车站) 去重。
+    """
+    __slots__ = ("date", "code", "from_code", "to_code", "from_name", "to_name",
+                 "start", "arrive", "dur", "seats", "_keys")
+
+    def __init__(self) -> None:
+        self.date: List[str] = []
+        self.code: List[str] = []
+        self.from_code: List[str] = []
+        self.to_code: List[str] = []
+        self.from_name: List[str] = []
+        self.to_name: List[str] = []
+        self.start: List[str] = []          # "HH:MM"
+        self.arrive: List[str] = []
+        self.dur: List[int] = []            # 分钟
+        self.seats: Dict[str, List[SeatValue]] = {name: [] for name in SEAT_NAMES}
+        self._keys: Dict[Tuple[str, str, str, str], int] = {}
+
+    def __len__(self) -> int:
+        return len(self.code)
+
+    @classmethod
+    def parse(cls, data: Dict[str, Any], date: str = "") -> "Trains":
+        t = cls()
+        t.add_result(data, date)
+        return t
+
+    def add_result(self, data: Dict[str, Any], date: str = "") -> None:
+        """追加一次 leftTicket/query 的返回；重复的车次跳过"""
+        mp = data["data"].get("map", {})
+        for row in data["data"]["result"]:
+            p = row.split("|")
+            if len(p) <= 32:
+                continue
+            key = (date, p[3], p[6], p[7])
+            if key in self._keys:
+                continue
+            self._keys[key] = len(self.code)
+            self.date.append(date)
+            self.code.append(p[3])
+            self.from_code.append(p[6])
+            self.to_code.append(p[7])
+            self.from_name.append(mp.get(p[6], p[6]))
+            self.to_name.append(mp.get(p[7], p[7]))
+            self.start.append(p[8])
+            self.arrive.append(p[9])
+            self.dur.append(_minutes(p[10]))
+            for name, _, i in SEATS:
+                self.seats[name].append(_seat(p[i]))
+
+    def find(self, code: str) -> Optional[int]:
+        code = code.upper()
+        return next((i for i, c in enumerate(self.code) if c.upper() == code), None)
+
+    def has_seats(self, i: int, seats: Sequence[str] = ()) -> bool:
+        return any(has_ticket(self.seats[s][i]) for s in (seats or SEAT_NAMES))
+
+    def select(
+            self,
+            types: str = "",
+            after: int = 0,
+            before: int = 24 * 60,
+            has_seats: bool = False,
+            seats: Sequence[str] = (),
+            sort: str = "dep"
+    ) -> List[int]:
+        """
+        types：车次首字母集合，如 "GD"；after / before：出发时间窗（分钟，闭区间）；
+        has_seats：只要有票的车（seats 非空时只看这些席别）；sort：dep / arr / dur
+        """
+        types = types.upper()
+        out = []
+        for i, code in enumerate(self.code):
+            if types and code[:1].upper() not in types:
+                continue
+            if not after <= _minutes(self.start[i]) <= before:
+                continue
+            if (has_seats or seats) and not self.has_seats(i, seats):
+                continue
+            out.append(i)
+        keys: Dict[str, Callable[[int], Any]] = {
+            "dep": lambda i: (self.date[i], self.start[i], self.code[i]),
+            "arr": lambda i: (self.date[i], _minutes(self.arrive[i]) + (24 * 60 if self.arrive[i] < self.start[i] else 0)),
+            "dur": lambda i: (self.date[i], self.dur[i], self.start[i]),
+        }
+        return sorted(out, key=keys.get(sort, keys["dep"]))
+
+    # ——— 输出 ——— #
+    def fmt_detail(self, i: int) -> str:
+        """两行的完整格式（单一线路查询时用）"""
+        d = self.dur[i]
+        seats = " ".join(f"{short}:{self._val(name, i)}" for name, short, _ in SEATS)
+        return (f"🚄{self.code[i]} {self.from_name[i]}->{self.to_name[i]} "
+                f"{self.start[i]}-{self.arrive[i]} 历时{d // 60:02d}:{d % 60:02d}\n{seats}")
+
+    def fmt_line(self, i: int, arrive: bool = False) -> str:
+        """一行的紧凑格式：只列有票的席别；arrive=True 时时刻写成 出发-到达"""
+        seats = " ".join(f"{short}:{self._val(name, i)}" for name, short, _ in SEATS
+                         if has_ticket(self.seats[name][i])) or "无票"
+        when = f"{self.start[i]}-{self.arrive[i]}" if arrive else self.start[i]
+        return f"{when} {self.code[i]} {self.from_name[i]}→{self.to_name[i]} {seats}"
+
+    def _val(self, name: str, i: int) -> str:
+        v = self.seats[name][i]
+        return "" if v is None else str(v)
+
+    def render(self, idx: List[int], detail: bool, per_page: int) -> List[str]:
+        """每 per_page 趟一页；结果跨多天时，每页开头和换日处加日期标题"""
+        multi_day = len({self.date[i] for i in idx}) > 1
+        pages = []
+        for k in range(0, len(idx), per_page):
+            lines: List[str] = []
+            cur = None
+            for i in idx[k:k + per_page]:
+                if multi_day and self.date[i] != cur:
+                    cur = self.date[i]
+                    lines.append(f"📅 {cur}")
+                lines.append(self.fmt_detail(i) if detail else self.fmt_line(i))
+            pages.append(("\n\n" if detail else "\n").join(lines))
+        return pages
+
+
+def parse_filters(tokens: Sequence[str]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    命令里的筛选词 → select() 参数，以及认不出的词：
+    G / GD / 高铁 / 动车    车型
+    8-12点 / 08:00-12:30   出发时间窗
+    有票 / 二等 …           只要有票（指定席别）
+    按出发 / 按到达 / 按历时  排序
+    """
+    opts: Dict[str, Any] = {}
+    rest: List[str] = []
+    for tok in tokens:
+        m = _WINDOW_RE.match(tok)
+        if tok in TRAIN_TYPES or re.fullmatch(r"[GDCZTKYLSgdcztkyls]{1,4}", tok):
+            opts["types"] = opts.get("types", "") + TRAIN_TYPES.get(tok, tok.upper())
+        elif m:
+            h1, m1, h2, m2 = m.groups()
+            opts["after"], opts["before"] = int(h1) * 60 + int(m1 or 0), int(h2) * 60 + int(m2 or 0)
+        elif tok == "有票":
+            opts["has_seats"] = True
+        elif seat_name(tok):
+            opts["seats"] = opts.get("seats", ()) + (seat_name(tok),)
+        elif tok in SORT_KEYS:
+            opts["sort"] = SORT_KEYS[tok]
+        else:
+            rest.append(tok)
+    return opts, rest
+
+
+class Pager:
+    """每个会话保存最近一次长回复的剩余页，TTL 过期或新查询覆盖"""
+
+    def __init__(self, ttl: float = 600.0, maxsize: int = 256) -> None:
+        self._pages = TTLCache(ttl=ttl, maxsize=maxsize)
+
+    def start(self, who: str, header: str, pages: List[str]) -> str:
+        """返回第一页；其余页留给 next()"""
+        if not pages:
+            self._pages.invalidate(who)
+            return header
+        if len(pages) > 1:
+            self._pages.put(who, {"pages": pages, "at": 1, "header": header})
+        else:
+            self._pages.invalidate(who)
+        return self._render(header, pages, 0)
+
+    def next(self, who: str) -> Optional[str]:
+        """下一页；没有可翻的页返回 None"""
+        st = self._pages.get(who)
+        if st is None:
+            return None
+        i = st["at"]
+        st["at"] += 1
+        if st["at"] >= len(st["pages"]):
+            self._pages.invalidate(who)
+        return self._render(st["header"], st["pages"], i)
+
+    def pending(self, who: str) -> bool:
+        return self._pages.get(who) is not None
+
+    @staticmethod
+    def _render(header: str, pages: List[str], i: int) -> str:
+        head = header if i == 0 else f"{header}（续）"
+        foot = f"（第 {i + 1}/{len(pages)} 页，回复“下一页”继续）" if i + 1 < len(pages) else \
+            (f"（第 {i + 1}/{len(pages)} 页，完）" if len(pages) > 1 else "")
+        return "\n".join(x for x in (head, pages[i], foot) if x)
@@ -0,0 +1,135 @@
+"""
+换乘（一次中转）方案搜索
+————————————————————————————————————————————
+• 中转站候选只取配置的枢纽表，按配置顺序，与起点 / 终点同城的跳过，每个城市一个（province 字段实际是城市名）。
+  .1.json 没有坐标、客流数据：index 只是表里的行号，region_code 也不按地理排，都不能用来判断大站或顺路
+• 两段分别按 (起点→中转, 中转→终点) 查询，结果是两张 tickets.Trains
+• 拼接：第二段按上车站分组、按发车时刻排序，第一段每趟车到站后用二分找出
+  [到站 + 最短换乘, 到站 + 最长等待] 内的车，只留最早到达终点的那趟；不做两两全配对。
+  时刻都换算成带日期的绝对分钟，第一段过夜到站、或要等到次日的第二段（调用方另查次日）都能衔接
+• 排序：全程时长，余票紧张（只剩几张）的方案加罚时
+"""
+import bisect
+from datetime import date as _date
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from stations import Station, StationIndex
+from tickets import SEAT_NAMES, Trains, _minutes
+
+SCARCE_SEATS = 5           # 余量少于这么多张算紧张
+SCARCE_PENALTY = 30        # 分钟，余票紧张的方案排序时加的罚时
+DAY = 24 * 60
+
+
+class Itinerary(NamedTuple):
+    first: int             # 第一段在 first Trains 里的行号
+    second: int            # 第二段在 second Trains 里的行号
+    total: int             # 全程分钟（第一段发车 → 第二段到达）
+    wait: int              # 中转等待分钟
+    scarce: bool           # 任一段余票紧张
+
+
+def pick_hubs(index: StationIndex, dep: Station, arr: Station, hubs: Sequence[str], limit: int = 4) -> List[Station]:
+    """从 hubs 里按配置顺序选出最多 limit 个中转站（每个城市一个，跳过起终点所在城市）"""
+    out: List[Station] = []
+    seen = {dep.province, arr.province}
+    for s in (index.find(h) for h in hubs):
+        if not s or s.province in seen:
+            continue
+        seen.add(s.province)
+        out.append(s)
+        if len(out) >= limit:
+            break
+    return out
+
+
+@lru_cache(maxsize=64)
+def _day(d: str) -> int:
+    return _date.fromisoformat(d).toordinal() * DAY if d else 0
+
+
+def clock(t: Trains, i: int) -> Tuple[int, int]:
+    """第 i 趟车的 (发车, 到站) 绝对分钟：日期序号 × 1440 + 当天分钟；没有日期时按第 0 天算"""
+    dep = _day(t.date[i]) + _minutes(t.start[i])
+    return dep, dep + t.dur[i]
+
+
+def overnight(first: Trains, first_idx: Sequence[int], max_wait: int) -> Set[str]:
+    """到站后最长等待会跨过发车当天午夜（含过夜到站）的第一段 → 到站电报码；这些中转站的第二段要再查次日"""
+    out = set()
+    for i in first_idx:
+        dep, arrive = clock(first, i)
+        if arrive + max_wait >= (dep // DAY + 1) * DAY:
+            out.add(first.to_code[i])
+    return out
+
+
+def _scarce(t: Trains, i: int, seats: Sequence[str]) -> bool:
+    """所选席别里没有“有”、最多也只剩几张"""
+    best = 0
+    for s in seats or SEAT_NAMES:
+        v = t.seats[s][i]
+        if v == "有":
+            return False
+        if isinstance(v, int):
+            best = max(best, v)
+    return best < SCARCE_SEATS
+
+
+def connect(
+        first: Trains,
+        second: Trains,
+        first_idx: Sequence[int],
+        second_idx: Sequence[int],
+        min_conn: int = 20,
+        max_wait: int = 240,
+        seats: Sequence[str] = (),
+        top: int = 5
+) -> List[Itinerary]:
+    """
+    first_idx / second_idx：两段中已筛选（车型 / 有票等）的行号；两段可以是不同日期的查询结果
+    （Trains.date 记着各自的日期），第一段到站必须与第二段上车站是同一个车站，车次不同。
+    """
+    by_station: Dict[str, Tuple[List[int], List[int]]] = {}
+    for start, j in sorted((clock(second, j)[0], j) for j in second_idx):
+        starts, js = by_station.setdefault(second.from_code[j], ([], []))
+        starts.append(start)
+        js.append(j)
+
+    out: List[Itinerary] = []
+    for i in first_idx:
+        group = by_station.get(first.to_code[i])
+        if not group:
+            continue
+        starts, js = group
+        dep, arrive = clock(first, i)
+        lo = bisect.bisect_left(starts, arrive + min_conn)
+        hi = bisect.bisect_right(starts, arrive + max_wait)
+        best: Optional[Tuple[int, int, int]] = None       # (到达终点, 第二段行号, 发车)
+        for k in range(lo, hi):
+            j = js[k]
+            if second.code[j] == first.code[i]:
+                continue
+            end = starts[k] + second.dur[j]
+            if best is None or end < best[0]:
+                best = (end, j, starts[k])
+        if best:
+            end, j, start2 = best
+            out.append(Itinerary(i, j, end - dep, start2 - arrive,
+                                 _scarce(first, i, seats) or _scarce(second, j, seats)))
+    out.sort(key=lambda it: (it.total + (SCARCE_PENALTY if it.scarce else 0), it.wait))
+    return out[:top]
+
+
+def render(first: Trains, second: Trains, plans: Sequence[Itinerary]) -> List[str]:
+    """每个方案三行：全程 / 中转站 / 等待，然后两段各一行"""
+    lines = []
+    for n, it in enumerate(plans, 1):
+        hub = first.to_name[it.first]
+        lines.append(f"{n}. 全程 {it.total // 60}:{it.total % 60:02d}  {hub} 换乘 等 {it.wait} 分"
+                     + ("  ⚠️ 余票紧张" if it.scarce else "")
+                     + f"\n   {first.fmt_line(it.first, arrive=True)}"
+                     + f"\n   {'次日 ' if second.date[it.second] > first.date[it.first] else ''}"
+                     + second.fmt_line(it.second, arrive=True))
+    return lines
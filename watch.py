@@ -0,0 +1,304 @@
+"""
+盯票：订阅 线路 / 日期 / 车次 / 席别，余票有变化时推送
+————————————————————————————————————————————
+• 同一 (出发, 到达, 日期) 的所有订阅合并成一组，每轮只查一次
+• 每组独立的自适应间隔：有变化就缩短，一直没变化就逐步拉长，失败退避；再加 ±JITTER 随机抖动
+• 全局令牌桶限制每分钟查询次数，订阅再多也不会把 12306 打爆
+• 只比较 tickets.Trains 解析出的席位余量（与“车票”回复同一套解析），没变化不发消息
+• 订阅原子地写入 JSON 文件，重启后继续
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import date as _date
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tickets import SEAT_NAMES, Trains
+
+JITTER = 0.2                 # 间隔随机抖动比例
+MAX_CHANGES_SHOWN = 12       # 一条通知最多列出几处变化
+
+GroupKey = Tuple[str, str, str]     # (出发码, 到达码, 日期)
+
+
+def seat_counts(data: Dict[str, Any], train: str = "", seats: Tuple[str, ...] = ()) -> Dict[str, str]:
+    """12306 JSON → {"G123 二等": "有" / "5" / "无", ...}；该车不设的席别不列出"""
+    t = Trains.parse(data)
+    out: Dict[str, str] = {}
+    for i, code in enumerate(t.code):
+        if train and code.upper() != train:
+            continue
+        for s in seats or SEAT_NAMES:
+            v = t.seats[s][i]
+            if v is not None:
+                out[f"{code} {s}"] = str(v)
+    return out
+
+
+class Watch:
+    __slots__ = ("id", "chat", "dep", "arr", "dep_code", "arr_code", "date", "train", "seats", "last", "created")
+
+    def __init__(self, id: int, chat: str, dep: str, arr: str, dep_code: str, arr_code: str, date: str,
+                 train: str = "", seats: Tuple[str, ...] = (), last: Optional[Dict[str, str]] = None,
+                 created: float = 0.0) -> None:
+        self.id = id
+        self.chat = chat
+        self.dep, self.arr = dep, arr
+        self.dep_code, self.arr_code = dep_code, arr_code
+        self.date = date
+        self.train = train.upper()
+        self.seats = tuple(seats)
+        self.last = last                   # 上一次的 seat_counts，None 表示还没查过
+        self.created = created or time.time()
+
+    @property
+    def key(self) -> GroupKey:
+        return self.dep_code, self.arr_code, self.date
+
+    def describe(self) -> str:
+        extra = " ".join(x for x in (self.train, "/".join(self.seats)) if x)
+        return f"#{self.id} {self.dep}→{self.arr} {self.date}" + (f" {extra}" if extra else "")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Watch":
+        return cls(**{**d, "seats": tuple(d.get("seats", ()))})
+
+
+class _Group:
+    __slots__ = ("due", "interval", "fails", "polls")
+
+    def __init__(self, interval: float) -> None:
+        self.due = 0.0                     # 新订阅尽快查一次，拿到比较基准
+        self.interval = interval
+        self.fails = 0
+        self.polls = 0
+
+
+class WatchScheduler:
+    def __init__(
+            self,
+            fetch: Callable[[str, str, str], Dict[str, Any]],
+            notify: Callable[[str, str], None],
+            path: Optional[Path] = None,
+            budget_per_min: int = 20,
+            min_interval: float = 60.0,
+            max_interval: float = 900.0,
+            per_chat: int = 10
+    ) -> None:
+        """
+        fetch(出发码, 到达码, 日期) → 12306 JSON；notify(会话名, 文本) 负责发消息。
+        budget_per_min：所有订阅合计每分钟最多查询几次。
+        """
+        self.fetch = fetch
+        self.notify = notify
+        self.path = Path(path) if path else None
+        self.budget_per_min = budget_per_min
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.per_chat = per_chat
+
+        self._cv = threading.Condition()
+        self._watches: Dict[int, Watch] = {}
+        self._groups: Dict[GroupKey, _Group] = {}
+        self._next_id = 1
+        self._tokens = float(budget_per_min)
+        self._refilled = time.monotonic()
+        self._running = False
+        self._gen = 0                      # 每次 start 加一，旧的调度线程看到后自行退出
+        self.polls = self.notified = self.failed = self.throttled = 0
+        self._load()
+
+    # ——— 订阅管理 ——— #
+    def add(self, chat: str, dep: str, arr: str, dep_code: str, arr_code: str, date: str,
+            train: str = "", seats: Tuple[str, ...] = ()) -> Watch:
+        """超出每个会话的上限时抛 ValueError"""
+        with self._cv:
+            if sum(w.chat == chat for w in self._watches.values()) >= self.per_chat:
+                raise ValueError(f"每个会话最多盯 {self.per_chat} 个")
+            w = Watch(self._next_id, chat, dep, arr, dep_code, arr_code, date, train, seats)
+            self._next_id += 1
+            self._watches[w.id] = w
+            g = self._groups.get(w.key)
+            if g is None:
+                self._groups[w.key] = _Group(self.min_interval)
+            else:
+                g.due = 0.0                # 新订阅没有基准，所在组提前查
+            self._save()
+            self._cv.notify()
+        logging.info("新增盯票 %s（%s）", w.describe(), chat)
+        return w
+
+    def remove(self, chat: str, wid: Optional[int] = None) -> List[Watch]:
+        """取消本会话的某个订阅；wid=None 时取消本会话全部"""
+        with self._cv:
+            gone = [w for w in self._watches.values() if w.chat == chat and wid in (None, w.id)]
+            for w in gone:
+                self._drop(w)
+            if gone:
+                self._save()
+        return gone
+
+    def list(self, chat: Optional[str] = None) -> List[Watch]:
+        with self._cv:
+            return sorted((w for w in self._watches.values() if chat in (None, w.chat)), key=lambda w: w.id)
+
+    def _drop(self, w: Watch) -> None:
+        """调用方需持有锁"""
+        self._watches.pop(w.id, None)
+        if not any(x.key == w.key for x in self._watches.values()):
+            self._groups.pop(w.key, None)
+
+    # ——— 启停 ——— #
+    def start(self) -> None:
+        with self._cv:
+            if self._running:
+                return
+            self._running = True
+            self._gen += 1
+            gen = self._gen
+        threading.Thread(target=self._run, args=(gen,), name="ticket-watch", daemon=True).start()
+
+    def stop(self) -> None:
+        with self._cv:
+            self._running = False
+            self._cv.notify_all()
+
+    # ——— 调度 ——— #
+    def _take_token(self, now: float) -> float:
+        """调用方需持有锁；拿到令牌返回 0，否则返回还需等待的秒数"""
+        rate = self.budget_per_min / 60.0
+        self._tokens = min(float(self.budget_per_min), self._tokens + (now - self._refilled) * rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / rate
+
+    def _run(self, gen: int) -> None:
+        while True:
+            with self._cv:
+                if not self._running or gen != self._gen:
+                    return
+                self._expire()
+                now = time.monotonic()
+                key = min(self._groups, key=lambda k: self._groups[k].due, default=None)
+                if key is None:
+                    self._cv.wait()
+                    continue
+                wait = self._groups[key].due - now
+                if wait <= 0:
+                    wait = self._take_token(now)
+                    if wait > 0:
+                        self.throttled += 1
+                if wait > 0:
+                    self._cv.wait(min(wait, 60))
+                    continue
+                watches = [w for w in self._watches.values() if w.key == key]
+            self._poll(key, watches)
+
+    def _poll(self, key: GroupKey, watches: List[Watch]) -> None:
+        try:
+            data = self.fetch(*key)
+            if not isinstance(data.get("data"), dict):
+                raise ValueError("返回数据格式不对")
+        except Exception as e:
+            logging.warning("盯票查询失败 %s：%s", key, e)
+            with self._cv:
+                self.failed += 1
+                g = self._groups.get(key)
+                if g:
+                    g.fails += 1
+                    self._reschedule(g, min(self.max_interval, g.interval * 2))
+            return
+
+        messages: List[Tuple[str, str]] = []
+        changed = False
+        with self._cv:
+            self.polls += 1
+            for w in watches:
+                if w.id not in self._watches:          # 查询期间被取消
+                    continue
+                cur = seat_counts(data, w.train, w.seats)
+                if w.last is not None and cur != w.last:
+                    changed = True
+                    messages.append((w.chat, self._format(w, w.last, cur)))
+                w.last = cur
+            g = self._groups.get(key)
+            if g:
+                g.polls += 1
+                g.fails = 0
+                # 有变化说明正在放票 / 退票，查勤一点；长期不变就慢慢放宽
+                iv = g.interval * 0.5 if changed else g.interval * 1.25
+                self._reschedule(g, min(self.max_interval, max(self.min_interval, iv)))
+            self._save()
+        for chat, text in messages:
+            try:
+                self.notify(chat, text)
+                self.notified += 1
+            except Exception as e:
+                logging.warning("盯票通知发送失败 %s：%s", chat, e)
+
+    def _reschedule(self, g: _Group, interval: float) -> None:
+        g.interval = interval
+        g.due = time.monotonic() + interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def _expire(self) -> None:
+        """调用方需持有锁；出发日期已过的订阅直接删除并通知"""
+        today = _date.today().isoformat()
+        old = [w for w in self._watches.values() if w.date < today]
+        for w in old:
+            self._drop(w)
+            threading.Thread(target=self.notify, args=(w.chat, f"⌛ 盯票 {w.describe()} 已过期，自动取消"),
+                             daemon=True).start()
+        if old:
+            self._save()
+
+    @staticmethod
+    def _format(w: Watch, old: Dict[str, str], new: Dict[str, str]) -> str:
+        lines = [f"🔔 余票变化 {w.describe()}"]
+        keys = sorted(set(old) | set(new))
+        diffs = [f"{k}：{old.get(k, '无')} → {new.get(k, '无')}" for k in keys if old.get(k) != new.get(k)]
+        lines += diffs[:MAX_CHANGES_SHOWN]
+        if len(diffs) > MAX_CHANGES_SHOWN:
+            lines.append(f"…… 另有 {len(diffs) - MAX_CHANGES_SHOWN} 处变化")
+        return "\n".join(lines)
+
+    # ——— 持久化 ——— #
+    def _save(self) -> None:
+        """调用方需持有锁"""
+        if not self.path:
+            return
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        try:
+            tmp.write_text(json.dumps({"next_id": self._next_id,
+                                       "watches": [w.to_dict() for w in self._watches.values()]},
+                                      ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning("盯票保存失败：%s", e)
+
+    def _load(self) -> None:
+        if not self.path or not self.path.exists():
+            return
+        try:
+            d = json.loads(self.path.read_text(encoding="utf-8"))
+            for item in d.get("watches", []):
+                w = Watch.from_dict(item)
+                self._watches[w.id] = w
+                self._groups.setdefault(w.key, _Group(self.min_interval))
+            self._next_id = max([d.get("next_id", 1)] + [w.id + 1 for w in self._watches.values()])
+            logging.info("已恢复 %d 个盯票", len(self._watches))
+        except Exception as e:
+            logging.warning("盯票读取失败：%s", e)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cv:
+            return {"watches": len(self._watches), "groups": len(self._groups), "polls": self.polls,
+                    "notified": self.notified, "failed": self.failed, "throttled": self.throttled}